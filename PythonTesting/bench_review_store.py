@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark the columnar ReviewStore against the old per-review dict lists.
+
+Replays the research + summary access pattern (course split, other-course
+split, course set, per-review processing, average rating) over synthetic
+PlanetTerp payloads. Reports build time (JSON payload -> working set), query
+time for the access pattern, and the memory each representation retains.
+
+Usage: python bench_review_store.py [--sizes 100 1000 5000] [--repeat 20]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from review_store import ReviewStore
+
+COURSES = [f"CMSC{n}" for n in range(100, 500, 7)] + [None]
+GRADES = ['A+', 'A', 'A-', 'B+', 'B', 'B-', 'C', 'W', 'P', None]
+
+
+def make_reviews(count, seed=0):
+    """Synthetic /v1/professor?reviews=true payload."""
+    rng = random.Random(seed)
+    return [{
+        "professor": "Jane Doe",
+        "course": rng.choice(COURSES),
+        "review": " ".join(rng.choice(["great", "hard", "exams", "lectures", "fair", "curve"]) for _ in range(rng.randint(20, 120))),
+        "rating": rng.choice([1, 2, 3, 4, 5, None]),
+        "expected_grade": rng.choice(GRADES),
+        "created": f"20{rng.randint(15, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00",
+    } for _ in range(count)]
+
+
+def legacy_pipeline(reviews, course_id, other_courses):
+    """The list-comprehension filtering and dict rebuilding the research path used to do."""
+    direct = [r for r in reviews if r.get("course") == course_id]
+    ratings = [r.get("rating") for r in direct if r.get("rating") is not None]
+    avg_rating = sum(ratings) / len(ratings) if ratings else 0
+    other = [r for r in reviews if r.get("course") != course_id and r.get("course") is not None]
+    other_courses_taught = sorted(set(r.get("course") for r in other if r.get("course") is not None))
+    course_set = [r for r in reviews if r.get("course") in other_courses]
+    processed = []
+    for bucket in (direct, other, course_set):
+        processed.append([{"Course": r.get("course", "Unknown") or "Unknown", "Rating": r.get("rating"),
+                           "Expected Grade": r.get("grade", ""), "Review": r.get("review", ""),
+                           "Date": r.get("created", "")[:10] if r.get("created") else ""} for r in bucket])
+    return avg_rating, other_courses_taught, processed
+
+
+def columnar_pipeline(store, course_id, other_courses):
+    """The same access pattern against a ReviewStore (rows only materialized for prompts)."""
+    direct = store.for_course(course_id)
+    avg_rating = direct.mean_rating()
+    other = store.excluding_course(course_id)
+    other_courses_taught = other.course_codes()
+    course_set = store.for_courses(other_courses)
+    processed = [list(bucket.head(10).iter_rows()) for bucket in (direct, other, course_set)]
+    return avg_rating, other_courses_taught, processed
+
+
+def time_call(func, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def retained_bytes(build):
+    """Bytes still allocated after `build()` returns, with its result kept alive."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ReviewStore vs dict-list benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    course_id = COURSES[0]
+    other_courses = COURSES[1:6]
+    print(f"{'reviews':>8} | {'dict build':>10} {'dict query':>10} {'dict mem':>10} | "
+          f"{'store build':>11} {'store query':>11} {'store mem':>10}")
+    for size in args.sizes:
+        payload = json.dumps(make_reviews(size))
+        legacy_build, reviews = time_call(json.loads, payload, repeat=args.repeat)
+        legacy_query, _ = time_call(legacy_pipeline, reviews, course_id, other_courses, repeat=args.repeat)
+        legacy_mem = retained_bytes(lambda: (lambda r: (r, legacy_pipeline(r, course_id, other_courses)))(json.loads(payload)))
+
+        store_build, store = time_call(lambda: ReviewStore.from_reviews(json.loads(payload)), repeat=args.repeat)
+        store_query, _ = time_call(columnar_pipeline, store, course_id, other_courses, repeat=args.repeat)
+        store_mem = retained_bytes(lambda: (lambda s: (s, columnar_pipeline(s, course_id, other_courses)))(
+            ReviewStore.from_reviews(json.loads(payload))))
+
+        print(f"{size:>8} | {legacy_build * 1000:>8.2f}ms {legacy_query * 1000:>8.2f}ms {legacy_mem / 1024:>8.0f}KB | "
+              f"{store_build * 1000:>9.2f}ms {store_query * 1000:>9.2f}ms {store_mem / 1024:>8.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
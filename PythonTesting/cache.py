@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""Pluggable cache shared by the research functions and Gemini summaries.
+
+Backends:
+    memory                      in-process dict (default; one per worker)
+    sqlite:///path/to/cache.db  local file shared by every process on the host
+    redis://host:6379/0         Redis-protocol server shared by every host
+
+Every backend stores JSON entries with a fresh deadline and a later hard
+expiry. get_or_compute() serves fresh entries directly, serves stale ones
+while a single worker refreshes them in the background, and on a miss lets
+only the lock holder compute while other workers wait for its result.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from profiling import span
+
+KEY_PREFIX = "terporacle:v1"
+
+# Seconds an entry is fresh, per key namespace
+TTLS = {
+    'testudo_section': 6 * 3600,
+    'testudo_course': 6 * 3600,
+    'planetterp_course': 24 * 3600,
+    'planetterp_professor': 24 * 3600,
+    'course_summary': 7 * 24 * 3600,
+    'overall_summary': 7 * 24 * 3600,
+    'analysis': 24 * 3600,  # stored analyses for incremental re-analysis
+}
+# Extra seconds a stale entry may still be served while it is refreshed
+STALE_TTL = 24 * 3600
+LOCK_TIMEOUT = 60
+
+
+def make_key(namespace, *parts):
+    """Build a cache key like 'terporacle:v1:planetterp_course:CMSC131'."""
+    return ":".join([KEY_PREFIX, namespace] + [str(part) for part in parts])
+
+
+def hash_key_part(*values):
+    """Stable short digest for long key parts such as prompts."""
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+class BaseCache:
+    """Backend interface plus the shared freshness/stampede logic.
+
+    Backends implement the raw string operations; values are JSON-encoded
+    here so every backend stores exactly the same entries.
+    """
+
+    def __init__(self):
+        self._refresh_tasks = set()
+
+    async def get_raw(self, key):
+        raise NotImplementedError
+
+    async def set_raw(self, key, raw, ttl):
+        raise NotImplementedError
+
+    async def delete(self, key):
+        raise NotImplementedError
+
+    async def acquire_lock(self, key, token, ttl):
+        """Take the lock for `key` if nobody holds it; return True on success."""
+        raise NotImplementedError
+
+    async def release_lock(self, key, token):
+        """Release the lock for `key` only if `token` still owns it."""
+        raise NotImplementedError
+
+    async def close(self):
+        for task in list(self._refresh_tasks):
+            task.cancel()
+
+    async def get_entry(self, key):
+        raw = await self.get_raw(key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    async def get(self, key):
+        """Return the cached value (fresh or stale), or None."""
+        entry = await self.get_entry(key)
+        return entry['value'] if entry else None
+
+    async def set(self, key, value, ttl, stale_ttl=STALE_TTL):
+        entry = {'value': value, 'fresh_until': time.time() + ttl}
+        await self.set_raw(key, json.dumps(entry), ttl + stale_ttl)
+
+    async def get_or_compute(self, key, compute, ttl, stale_ttl=STALE_TTL, should_cache=None,
+                             lock_timeout=LOCK_TIMEOUT):
+        """Return the value for `key`, calling `compute()` (a coroutine function) at most once per key across workers.
+
+        Values for which should_cache(value) is false (default: None) are
+        returned but not stored. Exceptions from compute() propagate.
+        stale_ttl=0 disables stale-while-revalidate: an expired entry is a
+        miss and compute() only ever runs for the caller awaiting it.
+        """
+        should_cache = should_cache or (lambda value: value is not None)
+        with span('cache lookup', 'cache', key=key, backend=type(self).__name__):
+            entry = await self.get_entry(key)
+        if entry and time.time() < entry['fresh_until']:
+            return entry['value']
+        if entry and stale_ttl > 0:
+            # Stale: answer now, let exactly one worker refresh in the background
+            token = uuid.uuid4().hex
+            if await self.acquire_lock(key, token, lock_timeout):
+                task = asyncio.create_task(self._refresh(key, token, compute, ttl, stale_ttl, should_cache))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return entry['value']
+
+        deadline = time.time() + lock_timeout
+        delay = 0.05
+        while True:
+            token = uuid.uuid4().hex
+            if await self.acquire_lock(key, token, lock_timeout):
+                try:
+                    value = await compute()
+                    if should_cache(value):
+                        await self.set(key, value, ttl, stale_ttl)
+                    return value
+                finally:
+                    await self.release_lock(key, token)
+            # Another worker is computing this key; wait for its result
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            entry = await self.get_entry(key)
+            if entry and time.time() < entry['fresh_until']:
+                return entry['value']
+            if time.time() > deadline:
+                return await compute()
+
+    async def _refresh(self, key, token, compute, ttl, stale_ttl, should_cache):
+        try:
+            value = await compute()
+            if should_cache(value):
+                await self.set(key, value, ttl, stale_ttl)
+        except Exception as e:
+            print(f"[*] Background refresh failed for {key}: {e}")
+        finally:
+            await self.release_lock(key, token)
+
+
+class MemoryCache(BaseCache):
+    """In-process cache; fine for one worker, duplicated across workers.
+
+    Expired entries are swept at most every `purge_interval` seconds (keys
+    that are never read again would otherwise live forever), and the
+    entries closest to expiry are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=10000, purge_interval=60):
+        super().__init__()
+        self._entries = {}
+        self._locks = {}
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._next_purge = time.time() + purge_interval
+
+    def purge_expired(self):
+        now = time.time()
+        self._entries = {key: item for key, item in self._entries.items() if item[1] > now}
+        self._locks = {key: holder for key, holder in self._locks.items() if holder[1] > now}
+        self._next_purge = now + self.purge_interval
+
+    async def get_raw(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        raw, expires = item
+        if time.time() >= expires:
+            del self._entries[key]
+            return None
+        return raw
+
+    async def set_raw(self, key, raw, ttl):
+        self._entries[key] = (raw, time.time() + ttl)
+        if time.time() >= self._next_purge or len(self._entries) > self.max_entries:
+            self.purge_expired()
+        if len(self._entries) > self.max_entries:
+            # Evict down to 90% so a full cache doesn't re-sort on every insert
+            overflow = len(self._entries) - int(self.max_entries * 0.9)
+            for old_key, _ in sorted(self._entries.items(), key=lambda item: item[1][1])[:overflow]:
+                del self._entries[old_key]
+
+    async def delete(self, key):
+        self._entries.pop(key, None)
+
+    async def acquire_lock(self, key, token, ttl):
+        holder = self._locks.get(key)
+        if holder and holder[1] > time.time():
+            return False
+        self._locks[key] = (token, time.time() + ttl)
+        return True
+
+    async def release_lock(self, key, token):
+        holder = self._locks.get(key)
+        if holder and holder[0] == token:
+            del self._locks[key]
+
+
+class SQLiteCache(BaseCache):
+    """Shared-file cache for several worker processes on one host.
+
+    Like MemoryCache, each process sweeps expired rows at most every
+    `purge_interval` seconds from set_raw, so write-once keys don't grow
+    the file forever.
+    """
+
+    def __init__(self, path, purge_interval=60):
+        super().__init__()
+        self.path = path
+        self.purge_interval = purge_interval
+        self._next_purge = time.time() + purge_interval
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL)")
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _run(self, func):
+        conn = self._connect()
+        try:
+            return func(conn)
+        finally:
+            conn.close()
+
+    def _get_raw(self, key):
+        def query(conn):
+            row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() >= row[1]:
+                conn.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, time.time()))
+                return None
+            return row[0]
+        return self._run(query)
+
+    def _set_raw(self, key, raw, ttl):
+        self._run(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", (key, raw, time.time() + ttl)))
+        if time.time() >= self._next_purge:
+            self.purge_expired()
+
+    def _acquire_lock(self, key, token, ttl):
+        def acquire(conn):
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM locks WHERE key = ? AND expires <= ?", (key, now))
+                cursor = conn.execute("INSERT OR IGNORE INTO locks (key, token, expires) VALUES (?, ?, ?)",
+                                      (key, token, now + ttl))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount == 1
+        return self._run(acquire)
+
+    async def get_raw(self, key):
+        return await asyncio.to_thread(self._get_raw, key)
+
+    async def set_raw(self, key, raw, ttl):
+        await asyncio.to_thread(self._set_raw, key, raw, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._run, lambda conn: conn.execute("DELETE FROM cache WHERE key = ?", (key,)))
+
+    async def acquire_lock(self, key, token, ttl):
+        return await asyncio.to_thread(self._acquire_lock, key, token, ttl)
+
+    async def release_lock(self, key, token):
+        await asyncio.to_thread(self._run, lambda conn: conn.execute(
+            "DELETE FROM locks WHERE key = ? AND token = ?", (key, token)))
+
+    def purge_expired(self):
+        """Drop expired entries and locks (the cache never grows past live keys plus stragglers)."""
+        now = time.time()
+        self._next_purge = now + self.purge_interval
+        self._run(lambda conn: (conn.execute("DELETE FROM cache WHERE expires <= ?", (now,)),
+                                conn.execute("DELETE FROM locks WHERE expires <= ?", (now,))))
+
+
+class RedisCache(BaseCache):
+    """Cache on any Redis-protocol server, shared by every worker and host.
+
+    Pass `client` to use an existing redis.asyncio-compatible client (for
+    example a fakeredis stand-in in local testing).
+    """
+
+    def __init__(self, url=None, client=None):
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise RuntimeError("The Redis cache backend requires the 'redis' package (pip install redis).") from e
+            client = redis_asyncio.from_url(url, decode_responses=True)
+        self.client = client
+        try:
+            from redis.exceptions import WatchError
+        except ImportError:
+            WatchError = Exception
+        self._watch_error = WatchError
+
+    async def get_raw(self, key):
+        raw = await self.client.get(key)
+        return raw.decode('utf-8') if isinstance(raw, bytes) else raw
+
+    async def set_raw(self, key, raw, ttl):
+        await self.client.set(key, raw, ex=max(1, int(ttl)))
+
+    async def delete(self, key):
+        await self.client.delete(key)
+
+    async def acquire_lock(self, key, token, ttl):
+        return bool(await self.client.set(f"{key}:lock", token, nx=True, px=int(ttl * 1000)))
+
+    async def release_lock(self, key, token):
+        # Compare-and-delete in a WATCH transaction (rather than a Lua script, which
+        # not every Redis-protocol stand-in supports) so a worker never releases a
+        # lock that expired and was re-acquired by another worker
+        lock_key = f"{key}:lock"
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lock_key)
+                holder = await pipe.get(lock_key)
+                if isinstance(holder, bytes):
+                    holder = holder.decode('utf-8')
+                if holder == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+                else:
+                    await pipe.unwatch()
+            except self._watch_error:
+                pass
+
+    async def close(self):
+        await super().close()
+        # redis-py >= 5 renamed close() to aclose()
+        close = getattr(self.client, 'aclose', None) or self.client.close
+        await close()
+
+
+def create_cache(url):
+    """Create a cache backend from a URL ('memory', 'sqlite:///path', 'redis://...')."""
+    if not url or url == 'memory':
+        return MemoryCache()
+    if url.startswith('sqlite:'):
+        path = url[len('sqlite:'):]
+        if path.startswith('///'):
+            path = path[3:]
+        return SQLiteCache(path or 'terporacle_cache.db')
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported cache URL: {url}")
+
+
+_cache = None
+
+
+def configure_cache(url=None):
+    """Install the process-wide cache (defaults to $TERPORACLE_CACHE, then memory)."""
+    global _cache
+    _cache = create_cache(url or os.environ.get('TERPORACLE_CACHE', 'memory'))
+    return _cache
+
+
+def get_cache():
+    """Return the process-wide cache, configuring it from the environment on first use."""
+    if _cache is None:
+        configure_cache()
+    return _cache
+
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
@@ -3,28 +3,197 @@ import os
 import sys
 import json
 import time
+import uuid
+import hashlib
 import argparse
 import asyncio # Import asyncio
 from PIL import Image
 import google.generativeai as genai
-import requests
+from google.ai import generativelanguage as glm
+from google.api_core import client_options as client_options_lib
+import httpx
 from bs4 import BeautifulSoup
 import re
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from schedule_grid import compute_schedule_metrics, format_schedule_metrics, format_meetings, meetings_from_course_info
+from fast_analysis import NEUTRAL_SCORE, build_fast_course_summary, build_fast_overall_summary, score_reviews
+from section_optimizer import DEFAULT_TOP_K, optimize_sections
+from review_store import ReviewStore
+from cache import TTLS, configure_cache, close_cache, get_cache, hash_key_part, make_key
+from profiling import span, start_profiling
+from name_index import MIN_ALIAS_SCORE, build_index, get_alias_table, is_placeholder_name
+
+
+FULL_MODEL_NAME = 'gemini-2.0-flash'
+LITE_MODEL_NAME = 'gemini-2.0-flash-lite'
+
+# Which model writes each course summary, by how much review evidence it has:
+# no reviews at all -> templated result without any LLM call ("skip"),
+# thin evidence -> the cheaper lite model, rich evidence -> the full model
+DEFAULT_ROUTING = {
+    'enabled': True,
+    'full_min_direct_reviews': 5,   # research stops at 5 direct reviews, so this is "well reviewed"
+    'full_min_total_reviews': 10,
+}
+
+
+# Timeout for Gemini summary calls; the cache lock around them must outlive it,
+# or a slow call loses its lock and waiters start paying for duplicate calls
+GEMINI_SUMMARY_TIMEOUT = 120
+SUMMARY_LOCK_TIMEOUT = GEMINI_SUMMARY_TIMEOUT + 30
+
+
+# Gemini clients per API key (keyed by a hash, never the key itself), shared by
+# every request using that key; least recently used keys are closed first
+GEMINI_CLIENT_CACHE_SIZE = 32
+# Evicted clients stay open this long so in-flight calls (120 s timeout) finish
+GEMINI_CLIENT_CLOSE_GRACE = 180
+_gemini_clients = OrderedDict()
+# Pending closes of evicted clients (asyncio only keeps weak references to tasks)
+_gemini_close_tasks = set()
+
+
+def get_gemini_clients(api_key):
+    """Return the shared (sync, async) Gemini clients for an API key, creating them on first use.
+
+    Clients are built directly with the key instead of via genai.configure(),
+    which is process-global and would race between users' requests.
+    """
+    cache_key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    clients = _gemini_clients.get(cache_key)
+    if clients is not None:
+        _gemini_clients.move_to_end(cache_key)
+        return clients
+    options = client_options_lib.ClientOptions(api_key=api_key)
+    clients = (glm.GenerativeServiceClient(client_options=options),
+               glm.GenerativeServiceAsyncClient(client_options=options))
+    _gemini_clients[cache_key] = clients
+    while len(_gemini_clients) > GEMINI_CLIENT_CACHE_SIZE:
+        _, evicted = _gemini_clients.popitem(last=False)
+        try:
+            task = asyncio.get_running_loop().create_task(close_client_pair_later(evicted))
+        except RuntimeError:
+            # No event loop (synchronous caller): nothing can be in flight, close now
+            asyncio.run(close_client_pair(evicted))
+            continue
+        _gemini_close_tasks.add(task)
+        task.add_done_callback(_gemini_close_tasks.discard)
+    return clients
+
+
+async def close_client_pair_later(clients):
+    """Close evicted clients after GEMINI_CLIENT_CLOSE_GRACE (immediately if cancelled on shutdown)."""
+    try:
+        await asyncio.sleep(GEMINI_CLIENT_CLOSE_GRACE)
+    finally:
+        await close_client_pair(clients)
+
+
+async def close_client_pair(clients):
+    sync_client, async_client = clients
+    try:
+        sync_client.transport.close()
+        await async_client.transport.close()
+    except Exception as e:
+        print_progress(f"Warning: could not close Gemini client: {e}")
+
+
+async def close_gemini_clients():
+    """Close every cached Gemini client, including evicted ones still in their grace period (call once on shutdown)."""
+    pending = list(_gemini_close_tasks)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    while _gemini_clients:
+        _, clients = _gemini_clients.popitem()
+        await close_client_pair(clients)
+
+
+def setup_gemini_api(api_key, routing=None):
+    """Set up Gemini models for the provided API key.
+
+    `routing` overrides DEFAULT_ROUTING keys (e.g. {'enabled': False} sends
+    every course summary to the full model).
+    """
+    sync_client, async_client = get_gemini_clients(api_key)
 
+    def bound_model(model_name):
+        # GenerativeModel has no client argument and otherwise falls back to
+        # the process-global default clients, so attach this key's clients
+        model = genai.GenerativeModel(model_name)
+        model._client = sync_client
+        model._async_client = async_client
+        return model
 
-def setup_gemini_api(api_key):
-    """Set up the Gemini API with the provided API key."""
-    genai.configure(api_key=api_key)
     # Use gemini-2.0-flash for both vision and analysis for speed
-    flash_model = genai.GenerativeModel(
-        'gemini-2.0-flash')  # Changed model name
+    flash_model = bound_model(FULL_MODEL_NAME)
     return {
         'vision_model': flash_model,
-        'analysis_model': flash_model
+        'analysis_model': flash_model,
+        'lite_model': bound_model(LITE_MODEL_NAME),
+        'routing': {**DEFAULT_ROUTING, **(routing or {})},
     }
 
 
+def choose_model_tier(research_data, routing=None):
+    """Return 'skip', 'lite' or 'full' for a course's summary from its review evidence."""
+    routing = {**DEFAULT_ROUTING, **(routing or {})}
+    if not routing['enabled']:
+        return 'full'
+    direct = len(research_data.get('direct_reviews') or [])
+    total = direct + sum(len(research_data.get(bucket) or [])
+                         for bucket in ('professor_other_reviews', 'course_other_reviews'))
+    if total == 0:
+        return 'skip'
+    if direct >= routing['full_min_direct_reviews'] or total >= routing['full_min_total_reviews']:
+        return 'full'
+    return 'lite'
+
+
+def record_llm_usage(llm_usage, tier, model, latency=None, response=None, cached=False, course=False):
+    """Accumulate per-tier call counts, latency and token usage into `llm_usage` (no-op when None)."""
+    if llm_usage is None:
+        return
+    stats = llm_usage.setdefault(tier, {
+        'model': getattr(model, 'model_name', None) if model else None, 'courses': 0, 'calls': 0,
+        'cache_hits': 0, 'latency_ms': 0.0, 'prompt_tokens': 0, 'output_tokens': 0, 'total_tokens': 0})
+    if course:
+        stats['courses'] += 1
+    if cached:
+        stats['cache_hits'] += 1
+    if latency is not None:
+        stats['calls'] += 1
+        stats['latency_ms'] = round(stats['latency_ms'] + latency * 1000, 1)
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is not None:
+        stats['prompt_tokens'] += getattr(metadata, 'prompt_token_count', 0) or 0
+        stats['output_tokens'] += getattr(metadata, 'candidates_token_count', 0) or 0
+        stats['total_tokens'] += getattr(metadata, 'total_token_count', 0) or 0
+
+
+# Shared across every analysis in the process so connections to Testudo and
+# PlanetTerp are pooled and kept alive instead of reopened per request
+_http_client = None
+
+
+def get_http_client():
+    """Return the process-wide async HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=15, follow_redirects=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client (call once on shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
 def print_progress(message):
     """Print a progress message with a consistent format."""
     print(f"[*] {message}")
@@ -43,7 +212,7 @@ def print_progress_bar(iteration, total, prefix='', suffix='', length=50, fill='
 # ===== STEP 1: Extract courses from schedule image (Optional) =====
 
 
-def extract_courses_from_image(image_path, vision_model):
+async def extract_courses_from_image(image_path, vision_model):
     """Extract course IDs and sections from an image using Gemini API."""
     if "manual_input_" in os.path.basename(image_path) and ".dummy" in image_path:
         print_progress("Skipping image analysis for manual input.")
@@ -61,8 +230,8 @@ def extract_courses_from_image(image_path, vision_model):
         Only include courses with both a valid course ID and section number.
         """
         print_progress("Sending image to Gemini vision model...")
-        # Vision model call remains synchronous for now
-        response = vision_model.generate_content([prompt, img], request_options={'timeout': 60})
+        with span('gemini vision', 'llm'):
+            response = await vision_model.generate_content_async([prompt, img], request_options={'timeout': 60})
         print_progress("Image processed.")
         json_text = response.text
         json_match = re.search(r'\[(.*?)\]', json_text, re.DOTALL)
@@ -109,67 +278,166 @@ def build_testudo_url(course_id, section_id=None, term_id="202508"):
     return f"{base_url}?{query_string}"
 
 
-def get_section_directly(course_id, section_id, term_id="202508"):
-    # This remains synchronous
+def parse_section_meetings(section_container):
+    """Parse every meeting (lecture, discussion, lab) listed for a Testudo section."""
+    meetings = []
+    # Each meeting is its own row inside the class-days container; older
+    # table layouts only expose a single days/start/end triple
+    meeting_rows = section_container.select('.class-days-container .row') or [section_container]
+    for row in meeting_rows:
+        class_days_elem = row.find(
+            ['span', 'td'], class_=['section-days', 'section-days-container'])
+        class_start_time_elem = row.find(
+            ['span', 'td'], class_=['class-start-time', 'section-start-time-container'])
+        class_end_time_elem = row.find(
+            ['span', 'td'], class_=['class-end-time', 'section-end-time-container'])
+        if not class_days_elem or not class_start_time_elem or not class_end_time_elem:
+            continue
+        class_type_elem = row.find('span', class_='class-type')
+        meetings.append({
+            'type': class_type_elem.text.strip() if class_type_elem else 'Lecture',
+            'days': class_days_elem.text.strip(),
+            'start': class_start_time_elem.text.strip(),
+            'end': class_end_time_elem.text.strip()
+        })
+    return meetings
+
+
+def parse_section_container(section_container):
+    """Parse one Testudo section row/div into a section dict (None if it has no section id)."""
+    section_id_elem = section_container.find(
+        ['span', 'td'], class_=['section-id', 'section-id-container'])
+    if not section_id_elem:
+        return None
+    instructors = []
+    instructor_elems = section_container.find_all(
+        ['div', 'span', 'td'], class_=['section-instructor', 'section-instructors'])
+    for instructor_elem in instructor_elems:
+        instructor_name = instructor_elem.text.strip()
+        if instructor_name and "TBA" not in instructor_name:
+            match = re.search(
+                r'Instructor(?:s)?:\s*(.*)', instructor_name, re.IGNORECASE)
+            instructors.append(match.group(
+                1).strip() if match else instructor_name)
+    meetings = parse_section_meetings(section_container)
+    days = meetings[0]['days'] if meetings else ""
+    time_str = f"{meetings[0]['start']} - {meetings[0]['end']}" if meetings else ""
+    open_seats_elem = section_container.find('span', class_='open-seats-count')
+    open_seats = int(open_seats_elem.text.strip()) if open_seats_elem and open_seats_elem.text.strip().isdigit() else None
+    return {'section_id': section_id_elem.text.strip(), 'instructors': instructors, 'days': days, 'time': time_str,
+            'meetings': meetings, 'open_seats': open_seats}
+
+
+def parse_course_sections(html, course_id):
+    """Parse every section of a course out of one Testudo search results page.
+
+    Returns {'course_id', 'course_title', 'sections': [...]} or None.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    course_divs = soup.find_all('div', class_='course')
+    if not course_divs:
+        print_progress("No matching course found on Testudo.")
+        return None
+    course_title = ""
+    for course_div in course_divs:
+        title_elem = course_div.find('span', class_='course-title')
+        if title_elem:
+            course_title = title_elem.text.strip()
+            break
+    all_section_divs = []
+    for course_div in course_divs:
+        section_divs = course_div.find_all(['div', 'tr'], class_=[
+                                           'section', 'section-info-container'])  # Look for divs or table rows
+        all_section_divs.extend(section_divs)
+    if not all_section_divs:
+        print_progress(
+            "Course found, but no section divs/rows detected in HTML structure.")
+        return None
+
+    sections = []
+    seen_section_ids = set()
+    for section_container in all_section_divs:
+        section = parse_section_container(section_container)
+        # Layouts that nest a section-info-container inside a section div list it twice
+        if section and section['section_id'] not in seen_section_ids:
+            seen_section_ids.add(section['section_id'])
+            sections.append(section)
+    return {'course_id': course_id, 'course_title': course_title, 'sections': sections}
+
+
+def section_course_info(course, section_id):
+    """Course info dict (as returned by get_section_directly) for one section of a parsed course, or None."""
+    for section in course['sections']:
+        if section['section_id'] == section_id:
+            return {'course_id': course['course_id'], 'course_title': course['course_title'], **section}
+    return None
+
+
+def parse_section_details(html, course_id, section_id):
+    """Parse one section's details out of a Testudo search results page."""
+    course = parse_course_sections(html, course_id)
+    if not course:
+        return None
+    course_info = section_course_info(course, section_id)
+    if not course_info:
+        print_progress(
+            f"Section {section_id} details not found within the course page.")
+    return course_info
+
+
+async def fetch_course_sections(course_id, term_id="202508"):
+    """Every section of a course from a single Testudo page (cached), or None."""
+    course_id = course_id.upper()
+    print_progress(f"Fetching all Testudo sections of {course_id} for term {term_id}")
+    url = build_testudo_url(course_id, None, term_id)
+
+    async def fetch_course():
+        with span('GET testudo course', 'http', course=course_id):
+            response = await get_http_client().get(url, timeout=15)
+        response.raise_for_status()
+
+        def parse():
+            with span('parse testudo html', 'parse', course=course_id, bytes=len(response.text)):
+                return parse_course_sections(response.text, course_id)
+        return await asyncio.to_thread(parse)
+
+    try:
+        return await get_cache().get_or_compute(
+            make_key('testudo_course', term_id, course_id), fetch_course, TTLS['testudo_course'])
+    except httpx.HTTPError as e:
+        print(f"Error fetching Testudo data: {e}")
+        return None
+    except Exception as e:
+        print(f"Error processing Testudo data: {e}")
+        return None
+
+
+async def get_section_directly(course_id, section_id, term_id="202508"):
     course_id = course_id.upper()
     section_id = section_id.strip().zfill(4)
     print_progress(
         f"Searching Testudo for {course_id} section {section_id} for term {term_id}")
     url = build_testudo_url(course_id, section_id, term_id)
-    try:
-        response = requests.get(url, timeout=10)  # Added timeout
+
+    async def fetch_section():
+        with span('GET testudo section', 'http', course=course_id, section=section_id):
+            response = await get_http_client().get(url, timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        course_divs = soup.find_all('div', class_='course')
-        if not course_divs:
-            print_progress("No matching course found on Testudo.")
-            return None
-        course_title = ""
-        for course_div in course_divs:
-            title_elem = course_div.find('span', class_='course-title')
-            if title_elem:
-                course_title = title_elem.text.strip()
-                break
-        all_section_divs = []
-        for course_div in course_divs:
-            section_divs = course_div.find_all(['div', 'tr'], class_=[
-                                               'section', 'section-info-container'])  # Look for divs or table rows
-            all_section_divs.extend(section_divs)
-        if not all_section_divs:
-            print_progress(
-                "Course found, but no section divs/rows detected in HTML structure.")
-            return None
 
-        for section_container in all_section_divs:
-            section_id_elem = section_container.find(
-                ['span', 'td'], class_=['section-id', 'section-id-container'])
-            if not section_id_elem:
-                continue
-            current_section_id = section_id_elem.text.strip()
-            if current_section_id == section_id:
-                instructors = []
-                instructor_elems = section_container.find_all(
-                    ['div', 'span', 'td'], class_=['section-instructor', 'section-instructors'])
-                for instructor_elem in instructor_elems:
-                    instructor_name = instructor_elem.text.strip()
-                    if instructor_name and "TBA" not in instructor_name:
-                        match = re.search(
-                            r'Instructor(?:s)?:\s*(.*)', instructor_name, re.IGNORECASE)
-                        instructors.append(match.group(
-                            1).strip() if match else instructor_name)
-                class_days_elem = section_container.find(
-                    ['span', 'td'], class_=['section-days', 'section-days-container'])
-                class_start_time_elem = section_container.find(
-                    ['span', 'td'], class_=['class-start-time', 'section-start-time-container'])
-                class_end_time_elem = section_container.find(
-                    ['span', 'td'], class_=['class-end-time', 'section-end-time-container'])
-                days = class_days_elem.text.strip() if class_days_elem else ""
-                time_str = f"{class_start_time_elem.text.strip()} - {class_end_time_elem.text.strip()}" if class_start_time_elem and class_end_time_elem else ""
-                return {'course_id': course_id, 'course_title': course_title, 'section_id': section_id, 'instructors': instructors, 'days': days, 'time': time_str}
-        print_progress(
-            f"Section {section_id} details not found within the course page.")
-        return None
-    except requests.exceptions.RequestException as e:
+        def parse():
+            with span('parse testudo html', 'parse', course=course_id, bytes=len(response.text)):
+                return parse_section_details(response.text, course_id, section_id)
+        # BeautifulSoup parsing is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(parse)
+
+    try:
+        # A cached full course listing (from --optimize) already has every section
+        course = await get_cache().get(make_key('testudo_course', term_id, course_id))
+        if course and section_course_info(course, section_id):
+            return section_course_info(course, section_id)
+        return await get_cache().get_or_compute(
+            make_key('testudo_section', term_id, course_id, section_id), fetch_section, TTLS['testudo_section'])
+    except httpx.HTTPError as e:
         print(f"Error fetching Testudo data: {e}")
         return None
     except Exception as e:
@@ -179,49 +447,94 @@ def get_section_directly(course_id, section_id, term_id="202508"):
 # ===== STEP 3: Enhanced PlanetTerp API Interaction =====
 
 
-def search_planetterp_professors(course_id=None):
-    # This remains synchronous
+class PlanetTerpError(Exception):
+    """PlanetTerp answered with an error status or error payload (never cached)."""
+
+
+async def search_planetterp_professors(course_id=None):
     if not course_id:
         return []
     print_progress(
         f"Searching PlanetTerp for professors who've taught {course_id}...")
-    api_url = f"https://api.planetterp.com/v1/course?name={course_id}"
-    try:
-        response = requests.get(api_url, timeout=10)
+    api_url = "https://api.planetterp.com/v1/course"
+
+    async def fetch_professors():
+        with span('GET planetterp /v1/course', 'http', course=course_id):
+            response = await get_http_client().get(api_url, params={"name": course_id}, timeout=10)
         if response.status_code != 200:
-            print_progress(f"PlanetTerp Error: Status {response.status_code}")
-            return []
+            raise PlanetTerpError(f"Status {response.status_code}")
         data = response.json()
         if "error" in data:
-            print_progress(f"PlanetTerp Error: {data['error']}")
-            return []
+            raise PlanetTerpError(data['error'])
         return data.get("professors", [])
+
+    try:
+        return await get_cache().get_or_compute(
+            make_key('planetterp_course', course_id), fetch_professors, TTLS['planetterp_course'])
+    except PlanetTerpError as e:
+        print_progress(f"PlanetTerp Error: {e}")
+        return []
     except Exception as e:
         print_progress(f"Error searching PlanetTerp professors: {e}")
         return []
 
 
-def get_professor_reviews(professor_name, course_id=None):
-    # This remains synchronous
+async def get_course_reviews(course_id):
+    """Every PlanetTerp review of a course (all professors) as a ReviewStore."""
+    print_progress(f"Fetching PlanetTerp reviews for {course_id}")
+    api_url = "https://api.planetterp.com/v1/course"
+
+    async def fetch_reviews():
+        with span('GET planetterp /v1/course reviews', 'http', course=course_id):
+            response = await get_http_client().get(
+                api_url, params={"name": course_id, "reviews": "true"}, timeout=15)
+        if response.status_code != 200:
+            raise PlanetTerpError(f"Status {response.status_code}")
+        data = response.json()
+        if "error" in data:
+            raise PlanetTerpError(data['error'])
+        return data.get("reviews", [])
+
+    try:
+        raw_reviews = await get_cache().get_or_compute(
+            make_key('planetterp_course', course_id, 'reviews'), fetch_reviews, TTLS['planetterp_course'])
+        with span('build review store', 'parse', reviews=len(raw_reviews)):
+            return ReviewStore.from_reviews(raw_reviews)
+    except PlanetTerpError as e:
+        print_progress(f"PlanetTerp Error: {e}")
+        return ReviewStore.empty()
+    except Exception as e:
+        print_progress(f"Error processing PlanetTerp reviews: {e}")
+        return ReviewStore.empty()
+
+
+async def get_professor_reviews(professor_name, course_id=None):
     if not professor_name:
-        return []
+        return ReviewStore.empty()
     print_progress(f"Fetching PlanetTerp reviews for {professor_name}" + (
         f" teaching {course_id}" if course_id else ""))
-    api_url = f"https://api.planetterp.com/v1/professor?name={professor_name}&reviews=true"
-    try:
+    api_url = "https://api.planetterp.com/v1/professor"
+
+    async def fetch_reviews():
         # Longer timeout for potentially large review data
-        response = requests.get(api_url, timeout=15)
+        with span('GET planetterp /v1/professor', 'http', professor=professor_name):
+            response = await get_http_client().get(
+                api_url, params={"name": professor_name, "reviews": "true"}, timeout=15)
         if response.status_code != 200:
-            print_progress(f"PlanetTerp Error: Status {response.status_code}")
-            return []
+            raise PlanetTerpError(f"Status {response.status_code}")
         data = response.json()
         if "error" in data:
-            print_progress(f"PlanetTerp Error: {data['error']}")
-            return []
-        all_reviews = data.get("reviews", [])
+            raise PlanetTerpError(data['error'])
+        return data.get("reviews", [])
+
+    try:
+        # The raw review list is cached; the columnar store is rebuilt per use
+        raw_reviews = await get_cache().get_or_compute(
+            make_key('planetterp_professor', professor_name, 'reviews'), fetch_reviews, TTLS['planetterp_professor'])
+        with span('build review store', 'parse', reviews=len(raw_reviews)):
+            all_reviews = ReviewStore.from_reviews(raw_reviews, professor=professor_name)
         if course_id:
-            filtered_reviews = [
-                r for r in all_reviews if r.get("course") == course_id]
+            filtered_reviews = all_reviews.for_course(course_id)
             print_progress(
                 f"Found {len(filtered_reviews)} reviews for {professor_name} teaching {course_id}")
             return filtered_reviews
@@ -229,30 +542,55 @@ def get_professor_reviews(professor_name, course_id=None):
             print_progress(
                 f"Found {len(all_reviews)} total reviews for {professor_name}")
             return all_reviews
+    except PlanetTerpError as e:
+        print_progress(f"PlanetTerp Error: {e}")
+        return ReviewStore.empty()
     except Exception as e:
         print_progress(f"Error processing PlanetTerp reviews: {e}")
-        return []
+        return ReviewStore.empty()
 
 
-def research_professor_and_course(professor_name, course_id, course_info=None):
-    # This remains synchronous
+async def resolve_professor_name(name, course_id):
+    """Map a Testudo instructor name to PlanetTerp's spelling (None if PlanetTerp doesn't list them for the course).
+
+    Uses the alias table, then the course's (cached) PlanetTerp professor
+    list, so no per-name API calls are spent on spelling mismatches.
+    """
+    if is_placeholder_name(name):
+        return None
+    aliases = get_alias_table()
+    alias = aliases.get(name)
+    if alias:
+        return alias
+    match, score = build_index(await search_planetterp_professors(course_id)).resolve(name)
+    if match and match != name:
+        print_progress(f"Resolved Testudo instructor '{name}' to PlanetTerp '{match}' (score {score})")
+        # Fuzzy matches are good enough for this lookup but too risky to pin forever
+        if score >= MIN_ALIAS_SCORE:
+            # The alias file is read, merged and rewritten; keep that off the event loop
+            await asyncio.to_thread(aliases.add, name, match)
+    return match
+
+
+async def research_professor_and_course(professor_name, course_id, course_info=None):
     research_data = {
         'course_id': course_id, 'professor': professor_name,
         'course_title': course_info.get('course_title', '') if course_info else '',
         'section_id': course_info.get('section_id', '') if course_info else '',
-        'schedule': f"{course_info.get('days', '')} {course_info.get('time', '')}".strip() if course_info else '',
-        'direct_reviews': [], 'professor_other_reviews': [], 'course_other_reviews': [],
+        'schedule': format_meetings(meetings_from_course_info(course_info)),
+        'meetings': meetings_from_course_info(course_info),
+        'direct_reviews': ReviewStore.empty(), 'professor_other_reviews': ReviewStore.empty(),
+        'course_other_reviews': ReviewStore.empty(),
         'professor_other_courses': [], 'course_other_professors': []
     }
     print_progress(
         f"RESEARCH STEP 1: Direct reviews for {professor_name} teaching {course_id}")
-    research_data['direct_reviews'] = get_professor_reviews(
-        professor_name, course_id)
+    # One fetch covers both step 1 and step 2; the course split is a column mask
+    all_professor_reviews = await get_professor_reviews(professor_name)
+    research_data['direct_reviews'] = all_professor_reviews.for_course(course_id)
     direct_review_count = len(research_data['direct_reviews'])
-    ratings = [r.get("rating") for r in research_data['direct_reviews'] if r.get(
-        "rating") is not None]
-    research_data['avg_rating'] = sum(ratings) / len(ratings) if ratings else 0
-    research_data['review_count'] = len(ratings)
+    research_data['avg_rating'] = research_data['direct_reviews'].mean_rating()
+    research_data['review_count'] = research_data['direct_reviews'].rated_count()
     print_progress(
         f"Found {direct_review_count} direct reviews for {professor_name} teaching {course_id}")
     if direct_review_count >= 5:
@@ -262,13 +600,8 @@ def research_professor_and_course(professor_name, course_id, course_info=None):
 
     print_progress(
         f"RESEARCH STEP 2: Other courses taught by {professor_name}")
-    all_professor_reviews = get_professor_reviews(
-        professor_name)  # Get all reviews for the prof
-    research_data['professor_other_reviews'] = [r for r in all_professor_reviews if r.get(
-        "course") != course_id and r.get("course") is not None]
-    research_data['professor_other_courses'] = sorted(list(set(r.get(
-        # Sort courses
-        "course") for r in research_data['professor_other_reviews'] if r.get("course") is not None)))
+    research_data['professor_other_reviews'] = all_professor_reviews.excluding_course(course_id)
+    research_data['professor_other_courses'] = research_data['professor_other_reviews'].course_codes()
     print_progress(
         f"Found {len(research_data['professor_other_reviews'])} reviews for {professor_name} teaching other courses")
     if research_data['professor_other_courses']:
@@ -277,48 +610,45 @@ def research_professor_and_course(professor_name, course_id, course_info=None):
 
     print_progress(
         f"RESEARCH STEP 3: Other professors who've taught {course_id}")
-    all_professors = search_planetterp_professors(course_id)
+    all_professors = await search_planetterp_professors(course_id)
     research_data['course_other_professors'] = sorted(
         [p for p in all_professors if p != professor_name])  # Sort professors
     print_progress(
         f"Found {len(research_data['course_other_professors'])} other professors who've taught {course_id}")
-    other_prof_reviews = []
     # Get reviews from a sample of other professors
     # Limit to 3 other professors for brevity
-    for prof in research_data['course_other_professors'][:3]:
+    sample_professors = research_data['course_other_professors'][:3]
+    for prof in sample_professors:
         print_progress(
             f"Getting sample reviews for {course_id} taught by {prof}")
-        prof_reviews = get_professor_reviews(prof, course_id)
-        # Take at most 5 reviews per professor
-        other_prof_reviews.extend(prof_reviews[:5])
-    research_data['course_other_reviews'] = other_prof_reviews
+    other_prof_reviews = await asyncio.gather(
+        *(get_professor_reviews(prof, course_id) for prof in sample_professors))
+    # Take at most 5 reviews per professor
+    research_data['course_other_reviews'] = ReviewStore.concat(
+        [prof_reviews.head(5) for prof_reviews in other_prof_reviews])
     print_progress(
         f"Collected {len(research_data['course_other_reviews'])} sample reviews for {course_id} from other professors")
     return research_data
 
 
-def process_review_data(reviews):
+def process_review_data(reviews, limit=None):
     # This remains synchronous
+    # Only the first `limit` rows of the ReviewStore are materialized as dicts
     if not reviews:
         return []
+    if limit is not None:
+        reviews = reviews.head(limit)
     review_data = []
-    total = len(reviews)
-    for i, review in enumerate(reviews):
-        # Removed progress bar from here for cleaner async logs
-        # if i % 10 == 0 or i == total - 1: print_progress_bar(...)
-        course = review.get("course", "Unknown") or "Unknown"
-        rating = review.get("rating")
-        grade = review.get("grade", "")
-        review_text = review.get("review", "")
-        date = review.get("created", "")[:10] if review.get("created") else ""
-        review_data.append({"Course": course, "Rating": rating,
-                           "Expected Grade": grade, "Review": review_text, "Date": date})
+    for review in reviews.iter_rows():
+        review_data.append({"Course": review["course"] or "Unknown", "Professor": review["professor"] or "Unknown",
+                            "Rating": review["rating"], "Expected Grade": review["expected_grade"],
+                            "Review": review["review"], "Date": review["created"]})
     return review_data
 
 # ===== STEP 4: Generate AI summaries (NOW ASYNC) =====
 
 
-async def generate_enhanced_course_summary(research_data, analysis_model): # Make async
+async def generate_enhanced_course_summary(research_data, analysis_model, llm_usage=None, tier='full'): # Make async
     print_progress(
         f"Generating AI analysis for {research_data['course_id']} with {research_data['professor']}...")
     course_id = research_data['course_id']
@@ -326,23 +656,23 @@ async def generate_enhanced_course_summary(research_data, analysis_model): # Mak
     course_title = research_data['course_title']
     schedule = research_data['schedule']
     direct_reviews_processed = process_review_data(
-        research_data['direct_reviews'])
+        research_data['direct_reviews'], limit=10)
     direct_reviews_text = "\n\n".join(
         # Simplified format
-        [f"DIRECT REVIEW (Rating: {r['Rating']}/5): {r['Review']}" for r in direct_reviews_processed[:10] if r["Review"]])
+        [f"DIRECT REVIEW (Rating: {r['Rating']}/5): {r['Review']}" for r in direct_reviews_processed if r["Review"]])
     prof_other_reviews_processed = process_review_data(
-        research_data['professor_other_reviews'])
+        research_data['professor_other_reviews'], limit=10)
     prof_other_courses = research_data['professor_other_courses']
     prof_other_reviews_text = "\n\n".join(
-        [f"PROF OTHER COURSE REVIEW ({r['Course']} - Rating: {r['Rating']}/5): {r['Review']}" for r in prof_other_reviews_processed[:10] if r["Review"]])
+        [f"PROF OTHER COURSE REVIEW ({r['Course']} - Rating: {r['Rating']}/5): {r['Review']}" for r in prof_other_reviews_processed if r["Review"]])
     course_other_reviews_processed = process_review_data(
-        research_data['course_other_reviews'])
+        research_data['course_other_reviews'], limit=10)
     course_other_professors = research_data['course_other_professors']
     # Extract professor names from course_other_reviews if available
     other_prof_names_in_reviews = list(
         set(r.get('Professor', 'Unknown') for r in course_other_reviews_processed))
     course_other_reviews_text = "\n\n".join(
-        [f"COURSE OTHER PROF REVIEW (Prof: {r.get('Professor', 'Unknown')} - Rating: {r['Rating']}/5): {r['Review']}" for r in course_other_reviews_processed[:10] if r["Review"]])
+        [f"COURSE OTHER PROF REVIEW (Prof: {r.get('Professor', 'Unknown')} - Rating: {r['Rating']}/5): {r['Review']}" for r in course_other_reviews_processed if r["Review"]])
     avg_rating = research_data['avg_rating']
     review_count = research_data['review_count']
 
@@ -368,33 +698,56 @@ async def generate_enhanced_course_summary(research_data, analysis_model): # Mak
     Finally, write a 1-2 paragraph **General Summary** synthesizing the key points for a student considering this specific course/professor combination. Focus on being helpful and objective. Use Markdown for formatting (like **bold** scores).
     """
     print_progress(f"Sending prompt for {course_id} to Gemini...") # Log before await
-    try:
+
+    generated = False
+
+    async def generate_summary():
+        nonlocal generated
+        generated = True
         # Use the async method with timeout
-        response = await analysis_model.generate_content_async(prompt, request_options={'timeout': 120}) # Use await and async method
-        print_progress(f"Received analysis for {course_id}") # Log after await
+        started = time.perf_counter()
+        with span('gemini course summary', 'llm', course=course_id, tier=tier, prompt_chars=len(prompt)):
+            response = await analysis_model.generate_content_async(prompt, request_options={'timeout': GEMINI_SUMMARY_TIMEOUT}) # Use await and async method
+        record_llm_usage(llm_usage, tier, analysis_model, time.perf_counter() - started, response)
         # Basic check for empty or error response from model
         if not response.text or "error" in response.text.lower():
             raise ValueError("Model returned empty or error response.")
+        return response.text
+
+    try:
+        # Identical prompts (same research data) reuse a cached summary
+        summary_text = await get_cache().get_or_compute(
+            make_key('course_summary', course_id, hash_key_part(getattr(analysis_model, 'model_name', ''), prompt)),
+            # No background refresh: it would spend this user's API key after the response
+            generate_summary, TTLS['course_summary'], stale_ttl=0, lock_timeout=SUMMARY_LOCK_TIMEOUT)
+        record_llm_usage(llm_usage, tier, analysis_model, cached=not generated, course=True)
+        print_progress(f"Received analysis for {course_id}") # Log after await
         return {
             'course_id': course_id, 'course_title': course_title, 'section_id': research_data.get('section_id', ''),
-            'professor': professor, 'schedule': schedule, 'avg_rating': avg_rating, 'review_count': review_count,
-            'summary': response.text,
+            'professor': professor, 'schedule': schedule, 'meetings': research_data.get('meetings', []),
+            'avg_rating': avg_rating, 'review_count': review_count,
+            'summary': summary_text, 'model_tier': tier,
             # Pass full research data back for potential use in JSON export
             'research_stats': research_data
         }
     except Exception as e:
         print_progress(f"Error generating AI summary for {course_id}: {e}")
+        record_llm_usage(llm_usage, tier, analysis_model, course=True)
         # Return error structure
         return {
             'course_id': course_id, 'course_title': course_title, 'section_id': research_data.get('section_id', ''),
-            'professor': professor, 'schedule': schedule, 'avg_rating': avg_rating, 'review_count': review_count,
-            'summary': f"Error generating AI summary: {e}",
+            'professor': professor, 'schedule': schedule, 'meetings': research_data.get('meetings', []),
+            'avg_rating': avg_rating, 'review_count': review_count,
+            'summary': f"Error generating AI summary: {e}", 'model_tier': tier,
+            'summary_error': True, # Never reused by /reanalyze
             'research_stats': research_data # Still return research data
         }
 
 
-async def generate_overall_schedule_summary(course_summaries, analysis_model): # Make async
+async def generate_overall_schedule_summary(course_summaries, analysis_model, schedule_metrics=None, llm_usage=None): # Make async
     print_progress("Generating overall schedule analysis...")
+    if schedule_metrics is None:
+        schedule_metrics = compute_schedule_metrics(course_summaries)
     courses_text = ""
     for idx, summary in enumerate(course_summaries, 1):
         # Include key details used by the prompt
@@ -404,12 +757,15 @@ async def generate_overall_schedule_summary(course_summaries, analysis_model): #
     Analyze the following UMD schedule consisting of {len(course_summaries)} course(s):
     {courses_text}
 
+    Exact Schedule Structure (computed from official meeting times, including labs/discussions):
+    {format_schedule_metrics(schedule_metrics)}
+
     Instructions:
     1.  **VERY IMPORTANT:** Start the entire response *immediately* with a single line formatted exactly like this: `Overall Schedule Grade: XX/100` where XX is your calculated overall score. Do not add any text before this line.
     2.  After the grade line, provide a comprehensive analysis with scores (out of 100) and detailed paragraph explanations for the following categories:
         *   **Overall Workload:** (Consider course levels, number of courses, known demands)
         *   **Professor Quality:** (Based on average ratings and review counts provided)
-        *   **Schedule Balance:** (Timing, back-to-back classes, day distribution)
+        *   **Schedule Balance:** (Timing, back-to-back classes, day distribution - use the exact schedule structure above rather than re-deriving it, and treat any listed conflict as a serious problem)
         *   **Subject Synergy:** (How well course topics might complement or conflict)
         *   **Difficulty Management:** (Combined challenge, potential bottlenecks)
         *   **Overall Schedule Quality:** (Synthesize pros/cons, offer advice/strategies - this is separate from the grade line at the start)
@@ -417,14 +773,29 @@ async def generate_overall_schedule_summary(course_summaries, analysis_model): #
     Base your analysis *only* on the information provided about the courses in the list. Use Markdown for formatting (like **bold** scores within the category explanations).
     """
     print_progress("Sending overall prompt to Gemini...") # Log before await
-    try:
+
+    generated = False
+
+    async def generate_overall():
+        nonlocal generated
+        generated = True
         # Use the async method with timeout
-        response = await analysis_model.generate_content_async(prompt, request_options={'timeout': 120}) # Use await and async method
-        print_progress("Received overall analysis.") # Log after await
+        started = time.perf_counter()
+        with span('gemini overall summary', 'llm', prompt_chars=len(prompt)):
+            response = await analysis_model.generate_content_async(prompt, request_options={'timeout': GEMINI_SUMMARY_TIMEOUT}) # Use await and async method
+        record_llm_usage(llm_usage, 'overall', analysis_model, time.perf_counter() - started, response)
         if not response.text or "error" in response.text.lower():
             raise ValueError(
                 "Model returned empty or error response for overall summary.")
         return response.text
+
+    try:
+        overall_text = await get_cache().get_or_compute(
+            make_key('overall_summary', hash_key_part(getattr(analysis_model, 'model_name', ''), prompt)),
+            generate_overall, TTLS['overall_summary'], stale_ttl=0, lock_timeout=SUMMARY_LOCK_TIMEOUT)
+        record_llm_usage(llm_usage, 'overall', analysis_model, cached=not generated)
+        print_progress("Received overall analysis.") # Log after await
+        return overall_text
     except Exception as e:
         print_progress(f"Error generating overall summary: {e}")
         return f"Error generating overall schedule analysis: {e}"
@@ -432,7 +803,7 @@ async def generate_overall_schedule_summary(course_summaries, analysis_model): #
 # ===== STEP 5: Output results =====
 
 
-def export_to_file(course_summaries, overall_summary, filename):
+def export_to_file(course_summaries, overall_summary, filename, schedule_metrics=None):
     # This remains synchronous
     print_progress(f"Exporting analysis to {filename}...")
     try:
@@ -441,6 +812,9 @@ def export_to_file(course_summaries, overall_summary, filename):
                 f"UMD SCHEDULE ANALYSIS\nGenerated: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             f.write("OVERALL SCHEDULE ANALYSIS\n" + "=" * 50 + "\n\n")
             f.write(overall_summary or "Overall summary generation failed.")
+            if schedule_metrics:
+                f.write("\n\nSCHEDULE STRUCTURE\n" + "-" * 50 + "\n")
+                f.write(format_schedule_metrics(schedule_metrics))
             f.write("\n\n" + "=" * 50 +
                     "\n\nINDIVIDUAL COURSE ANALYSES\n" + "=" * 50 + "\n\n")
             if not course_summaries:
@@ -485,34 +859,47 @@ def parse_overall_grade(summary_text):
             return None
     return None
 
-def export_to_json(course_summaries, overall_summary_text, filename):
-     # This remains synchronous
-    print_progress(f"Exporting JSON data to {filename}...")
-
+def serialize_course_summary(summary):
+    """JSON-serializable copy of a course summary (review stores become PlanetTerp-shaped dicts)."""
+    s_copy = summary.copy()
+    if 'research_stats' in s_copy and isinstance(s_copy['research_stats'], dict):
+         # Copy so converting the review stores doesn't mutate the caller's research data
+         s_copy['research_stats'] = dict(s_copy['research_stats'])
+         s_copy['research_stats']['professor_other_courses'] = list(s_copy['research_stats'].get('professor_other_courses', []))
+         s_copy['research_stats']['course_other_professors'] = list(s_copy['research_stats'].get('course_other_professors', []))
+         for bucket in ('direct_reviews', 'professor_other_reviews', 'course_other_reviews'):
+             reviews = s_copy['research_stats'].get(bucket)
+             s_copy['research_stats'][bucket] = reviews.to_records() if isinstance(reviews, ReviewStore) else list(reviews or [])
+    else:
+         s_copy['research_stats'] = {}
+    return s_copy
+
+
+def build_json_data(course_summaries, overall_summary_text, schedule_metrics=None, mode='full', llm_usage=None):
+    """Build the JSON-serializable analysis result returned by the web API and written by export_to_json."""
     # Parse the overall grade
     overall_grade = parse_overall_grade(overall_summary_text)
     print_progress(f"Parsed Overall Grade: {overall_grade}") # Log parsed grade
 
     # Ensure research_stats is serializable
-    serializable_summaries = []
-    for summary in course_summaries:
-        s_copy = summary.copy()
-        if 'research_stats' in s_copy and isinstance(s_copy['research_stats'], dict):
-             s_copy['research_stats']['professor_other_courses'] = list(s_copy['research_stats'].get('professor_other_courses', []))
-             s_copy['research_stats']['course_other_professors'] = list(s_copy['research_stats'].get('course_other_professors', []))
-             s_copy['research_stats']['direct_reviews'] = list(s_copy['research_stats'].get('direct_reviews', []))
-             s_copy['research_stats']['professor_other_reviews'] = list(s_copy['research_stats'].get('professor_other_reviews', []))
-             s_copy['research_stats']['course_other_reviews'] = list(s_copy['research_stats'].get('course_other_reviews', []))
-        else:
-             s_copy['research_stats'] = {}
-        serializable_summaries.append(s_copy)
+    serializable_summaries = [serialize_course_summary(summary) for summary in course_summaries]
 
-    json_data = {
-        "metadata": {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "course_count": len(serializable_summaries)},
+    metadata = {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "course_count": len(serializable_summaries), "mode": mode}
+    if llm_usage:
+        metadata["llm_usage"] = llm_usage
+    return {
+        "metadata": metadata,
         "overall_grade": overall_grade, # Add the parsed grade
         "overall_analysis": overall_summary_text or "Overall summary generation failed.",
+        "schedule_metrics": schedule_metrics or {},
         "courses": serializable_summaries
     }
+
+
+def export_to_json(course_summaries, overall_summary_text, filename, schedule_metrics=None, mode='full', llm_usage=None):
+     # This remains synchronous
+    print_progress(f"Exporting JSON data to {filename}...")
+    json_data = build_json_data(course_summaries, overall_summary_text, schedule_metrics, mode, llm_usage)
     try:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(json_data, f, indent=2)
@@ -531,6 +918,344 @@ def export_to_json(course_summaries, overall_summary_text, filename):
     except Exception as e:
         print_progress(f"Error exporting JSON file: {e}")
 
+# ===== Pipeline (shared by the CLI and the web server) =====
+
+
+def course_key(course_id, section):
+    """Normalized (COURSE_ID, SECTION) pair identifying one course section."""
+    return (str(course_id).strip().upper(), str(section).strip().zfill(4))
+
+
+def dedupe_courses(courses, source="input"):
+    """Drop repeated course/section pairs, keeping the first occurrence."""
+    unique_courses = []
+    processed_combinations = set()  # Keep track of processed course-section pairs
+    for course in courses:
+        key = course_key(course['course_id'], course['section'])
+        if key not in processed_combinations:
+            unique_courses.append(course)
+            processed_combinations.add(key)
+        else:
+            print_progress(
+                f"Skipping duplicate {source}: {key[0]}-{key[1]}")
+    return unique_courses
+
+
+async def research_course(course, term_id):
+    """Run Testudo + PlanetTerp research for one course/section.
+
+    Returns research data for generate_enhanced_course_summary, or a
+    finished placeholder summary when no professor can be found.
+    """
+    print_progress(f"Researching {course['course_id']}-{course['section']}...")
+    with span('testudo lookup', course=course['course_id'], section=course['section']):
+        course_info = await get_section_directly(course['course_id'], course['section'], term_id)
+    if not course_info:
+        print_progress(f"Could not find Testudo info. Trying PlanetTerp...")
+        course_info = {'course_id': course['course_id'], 'section_id': course['section'], 'instructors': ['Unknown']} # Minimal info
+
+    professors = [p for p in course_info.get('instructors', []) if not is_placeholder_name(p)]
+    professor_to_analyze = 'Unknown' # Default
+    if professors:
+         # Co-instructors are tried in order; the first one PlanetTerp lists for this course wins
+         for name in professors:
+              resolved = await resolve_professor_name(name, course['course_id'])
+              if resolved:
+                   professor_to_analyze = resolved
+                   break
+         else:
+              professor_to_analyze = professors[0] # New to this course on PlanetTerp; try the name as listed
+    else:
+         # Try PlanetTerp if Testudo failed or gave TBA
+         print_progress(f"Searching PlanetTerp for professors of {course['course_id']}...")
+         pt_profs = await search_planetterp_professors(course['course_id'])
+         if pt_profs:
+              professor_to_analyze = pt_profs[0] # Use first found from PlanetTerp
+              print_progress(f"Found potential professor via PlanetTerp: {professor_to_analyze}")
+         else:
+              print_progress(f"No professor found for {course['course_id']}. Cannot generate detailed analysis.")
+
+    if professor_to_analyze != 'Unknown':
+         # Store data needed for summary generation
+         with span('planetterp research', professor=professor_to_analyze):
+             return await research_professor_and_course(professor_to_analyze, course['course_id'], course_info)
+    # Placeholder for courses without a professor
+    return {
+        'course_id': course['course_id'], 'course_title': course_info.get('course_title', 'N/A'),
+        'section_id': course['section'], 'professor': 'Unknown',
+        'schedule': format_meetings(meetings_from_course_info(course_info)) or 'N/A',
+        'meetings': meetings_from_course_info(course_info),
+        'avg_rating': 0, 'review_count': 0, 'summary': 'Professor information unavailable. Cannot perform detailed analysis.',
+        'research_stats': {}
+    }
+
+
+async def analyze_courses(courses, term_id, models=None, fast=False, reuse=None, llm_usage=None):
+    """Research and analyze a list of unique courses.
+
+    Returns (course_summaries, overall_summary, schedule_metrics). With
+    fast=True no Gemini calls are made and `models` may be None. `reuse`
+    maps course_key() pairs to finished summaries from an earlier analysis;
+    those courses skip research and per-course summaries entirely. Pass a
+    dict as `llm_usage` to collect per-tier Gemini latency and token usage.
+    """
+    reuse = reuse or {}
+    keys = [course_key(course['course_id'], course['section']) for course in courses]
+    new_courses = [course for course, key in zip(courses, keys) if key not in reuse]
+    if reuse:
+        print_progress(f"Reusing {len(courses) - len(new_courses)} unchanged course analyses; analyzing {len(new_courses)} new.")
+
+    # --- Gather Research Data Concurrently ---
+    print("\n" + "=" * 50 + "\nGATHERING COURSE AND REVIEW DATA (CONCURRENTLY)\n" + "=" * 50)
+    with span('research', course_count=len(new_courses)):
+        # Named tasks give each course its own lane in --profile timelines
+        research_tasks_data = await asyncio.gather(*(
+            asyncio.create_task(research_course(course, term_id), name=f"research {course['course_id']}-{course['section']}")
+            for course in new_courses))
+
+    if fast:
+        print("\n" + "=" * 50 + "\nGENERATING FAST ANALYSIS (NO LLM)\n" + "=" * 50)
+        with span('fast analysis'):
+            new_summaries = [build_fast_course_summary(data) for data in research_tasks_data]
+            course_summaries = merge_course_summaries(keys, new_courses, new_summaries, reuse)
+            schedule_metrics = compute_schedule_metrics(course_summaries)
+            overall_summary = build_fast_overall_summary(course_summaries, schedule_metrics)
+        return course_summaries, overall_summary, schedule_metrics
+
+    # --- Generate Individual Summaries Concurrently ---
+    print("\n" + "=" * 50 + "\nGENERATING INDIVIDUAL COURSE SUMMARIES (CONCURRENTLY)\n" + "=" * 50)
+    summary_tasks = []
+    for data in research_tasks_data:
+        tier = choose_model_tier(data, models.get('routing')) if data.get('professor') != 'Unknown' else None
+        if tier == 'skip':
+             # No reviews in any bucket: the model could only answer "insufficient information"
+             print_progress(f"No PlanetTerp reviews for {data['course_id']}; using a templated summary (no LLM call).")
+             summary = build_fast_course_summary(data)
+             summary['model_tier'] = 'skip'
+             record_llm_usage(llm_usage, 'skip', None, course=True)
+             summary_tasks.append(asyncio.sleep(0, result=summary))
+        elif tier: # Only generate summary if we have a professor
+             model = models['lite_model'] if tier == 'lite' and models.get('lite_model') else models['analysis_model']
+             summary_tasks.append(
+                 # Create an awaitable task for each summary generation
+                 asyncio.create_task(generate_enhanced_course_summary(data, model, llm_usage, tier),
+                                     name=f"summary {data['course_id']}-{data.get('section_id', '')}")
+             )
+        else:
+             # If professor was unknown, create a task that immediately returns the placeholder data
+             summary_tasks.append(asyncio.sleep(0, result=data)) # Use asyncio.sleep(0, result=...)
+
+    # Run tasks concurrently and gather results
+    # Results will be in the order the tasks were created
+    with span('course summaries', course_count=len(summary_tasks)):
+        new_summaries = await asyncio.gather(*summary_tasks)
+
+    # Filter out potential None results if any task failed unexpectedly, though errors should be handled within generate_enhanced_course_summary
+    course_summaries = merge_course_summaries(keys, new_courses, new_summaries, reuse)
+    if not course_summaries:
+        return [], None, {}
+
+    # --- Generate Overall Summary Sequentially (after individuals are done) ---
+    print("\n" + "=" * 50 + "\nGENERATING OVERALL SCHEDULE ANALYSIS\n" + "=" * 50)
+    with span('overall summary'):
+        schedule_metrics = compute_schedule_metrics(course_summaries)
+        overall_summary = await generate_overall_schedule_summary(
+            course_summaries, models['analysis_model'], schedule_metrics, llm_usage) # Await the async function
+    return course_summaries, overall_summary, schedule_metrics
+
+
+def merge_course_summaries(keys, new_courses, new_summaries, reuse):
+    """Put reused and freshly computed summaries back in schedule order, dropping failed ones."""
+    fresh = {course_key(course['course_id'], course['section']): summary
+             for course, summary in zip(new_courses, new_summaries)}
+    merged = [reuse[key] if key in reuse else fresh.get(key) for key in keys]
+    return [s for s in merged if s is not None]
+
+
+# ===== Incremental re-analysis =====
+
+ANALYSIS_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+# Course summary fields a stored analysis keeps for reuse (review text is left out)
+STORED_SUMMARY_FIELDS = ('course_id', 'course_title', 'section_id', 'professor', 'schedule', 'meetings',
+                         'avg_rating', 'review_count', 'summary', 'model_tier', 'fast_stats')
+
+
+def compact_course_summary(summary):
+    """The parts of a course summary reuse needs: display fields, meetings, fast_stats and review counts."""
+    compact = {field: summary[field] for field in STORED_SUMMARY_FIELDS if field in summary}
+    stats = summary.get('research_stats') or {}
+    compact['research_stats'] = {
+        'professor_other_courses': list(stats.get('professor_other_courses', [])),
+        'course_other_professors': list(stats.get('course_other_professors', [])),
+        'review_counts': {bucket: len(stats.get(bucket) or [])
+                          for bucket in ('direct_reviews', 'professor_other_reviews', 'course_other_reviews')},
+    }
+    return compact
+
+
+async def save_analysis(courses, term_id, mode, course_summaries):
+    """Store an analysis so later edits can be re-analyzed incrementally; return its id (None on failure)."""
+    analysis_id = uuid.uuid4().hex
+    record = {
+        'term_id': term_id, 'mode': mode,
+        'courses': [{'course_id': c['course_id'], 'section': c['section']} for c in courses],
+        # Failed summaries are left out so an edit regenerates them instead of freezing the error
+        'course_summaries': [compact_course_summary(summary) for summary in course_summaries
+                             if not summary.get('summary_error')],
+    }
+    try:
+        await get_cache().set(make_key('analysis', analysis_id), record, TTLS['analysis'], stale_ttl=0)
+    except Exception as e:
+        print_progress(f"Warning: could not store analysis for re-analysis: {e}")
+        return None
+    return analysis_id
+
+
+async def load_analysis(analysis_id):
+    """Return a stored analysis record, or None if the id is unknown or expired."""
+    if not isinstance(analysis_id, str) or not ANALYSIS_ID_PATTERN.fullmatch(analysis_id):
+        return None
+    return await get_cache().get(make_key('analysis', analysis_id))
+
+
+def is_nonempty_string(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def apply_schedule_diff(courses, added=None, removed=None, changed=None):
+    """Apply an edit to a course list.
+
+    `removed` entries drop a section ({'course_id', 'section'}) or every
+    section of a course ({'course_id'}); `changed` entries swap the section
+    of a course already on the schedule ({'course_id', 'section'}, plus an
+    optional 'from_section' when the course appears more than once); `added`
+    entries are appended. Raises ValueError on malformed entries.
+    """
+    def validate(entries, name, needs_section=True):
+        if entries is None:
+            return []
+        if not isinstance(entries, list):
+            raise ValueError(f"'{name}' must be a list.")
+        for entry in entries:
+            if not isinstance(entry, dict) or not is_nonempty_string(entry.get('course_id')) or \
+                    (needs_section and not is_nonempty_string(entry.get('section'))):
+                raise ValueError(f"Each '{name}' entry must have a string 'course_id'" +
+                                 (" and 'section'." if needs_section else "."))
+            for optional in ('section', 'from_section'):
+                if entry.get(optional) is not None and not is_nonempty_string(entry[optional]):
+                    raise ValueError(f"'{optional}' in '{name}' entries must be a non-empty string.")
+        return entries
+
+    removed = validate(removed, 'removed', needs_section=False)
+    changed = validate(changed, 'changed')
+    added = validate(added, 'added')
+
+    result = [dict(course) for course in courses]
+    for entry in removed:
+        course_id, section = course_key(entry['course_id'], entry.get('section', ''))
+        result = [c for c in result if course_key(c['course_id'], c['section'])[0] != course_id or
+                  (entry.get('section') and course_key(c['course_id'], c['section'])[1] != section)]
+    for entry in changed:
+        course_id = course_key(entry['course_id'], '')[0]
+        from_section = course_key(course_id, entry['from_section'])[1] if entry.get('from_section') else None
+        for course in result:
+            existing_id, existing_section = course_key(course['course_id'], course['section'])
+            if existing_id == course_id and from_section in (None, existing_section):
+                course['section'] = entry['section']
+                break
+        else:
+            result.append({'course_id': course_id, 'section': entry['section']})
+    result.extend({'course_id': entry['course_id'].strip().upper(), 'section': entry['section'].strip()} for entry in added)
+    return dedupe_courses(result, "after edit")
+
+
+async def reanalyze_courses(previous, courses, models=None, fast=None, llm_usage=None):
+    """Analyze an edited schedule, reusing the stored summaries of unchanged sections.
+
+    `previous` is a load_analysis() record and `courses` the edited course
+    list. Only new sections are researched and summarized; the overall
+    summary is always regenerated. Summaries are only reused when the mode
+    matches the stored analysis (fast=None keeps the stored mode). Returns
+    (course_summaries, overall_summary, schedule_metrics, reused_count).
+    """
+    fast = previous['mode'] == 'fast' if fast is None else fast
+    reuse = {}
+    if previous['mode'] == ('fast' if fast else 'full'):
+        reuse = {course_key(s['course_id'], s.get('section_id', '')): s for s in previous['course_summaries']
+                 if not s.get('summary_error')}
+        wanted = {course_key(c['course_id'], c['section']) for c in courses}
+        reuse = {key: summary for key, summary in reuse.items() if key in wanted}
+    course_summaries, overall_summary, schedule_metrics = await analyze_courses(
+        courses, previous['term_id'], models, fast=fast, reuse=reuse, llm_usage=llm_usage)
+    return course_summaries, overall_summary, schedule_metrics, len(reuse)
+
+
+# ===== Section alternatives optimizer =====
+
+
+async def score_course_sections(course):
+    """Copy of a parsed course's sections with a 0-100 'professor_score' from PlanetTerp reviews of the course."""
+    reviews = await get_course_reviews(course['course_id'])
+    professor_scores = {}
+    sections = []
+    for section in course['sections']:
+        scores = []
+        for name in section['instructors']:
+            resolved = await resolve_professor_name(name, course['course_id'])
+            if not resolved:
+                continue
+            if resolved not in professor_scores:
+                professor_scores[resolved] = score_reviews(reviews.for_professor(resolved))
+            scores.append(professor_scores[resolved])
+        # Co-taught sections get their best-rated instructor's score
+        sections.append(dict(section, professor_score=max(scores) if scores else NEUTRAL_SCORE))
+    return sections
+
+
+async def optimize_schedule(course_ids, term_id, top_k=DEFAULT_TOP_K):
+    """Rank the top-K conflict-free section combinations for a list of course ids.
+
+    Returns {'term_id', 'course_titles', 'schedules', 'missing_courses', 'stats'}.
+    """
+    course_ids = list(dict.fromkeys(c.strip().upper() for c in course_ids if c and c.strip()))
+    print("\n" + "=" * 50 + f"\nOPTIMIZING SECTIONS FOR {', '.join(course_ids)}\n" + "=" * 50)
+    with span('fetch sections', course_count=len(course_ids)):
+        listings = await asyncio.gather(*(fetch_course_sections(course_id, term_id) for course_id in course_ids))
+    courses = [listing for listing in listings if listing and listing['sections']]
+    missing = [course_id for course_id, listing in zip(course_ids, listings) if not listing or not listing['sections']]
+    for course_id in missing:
+        print_progress(f"No sections found for {course_id}; optimizing without it.")
+    result = {'term_id': term_id, 'course_titles': {c['course_id']: c['course_title'] for c in courses},
+              'schedules': [], 'missing_courses': missing, 'stats': {}}
+    if not courses:
+        return result
+
+    with span('score sections', course_count=len(courses)):
+        scored_sections = await asyncio.gather(*(score_course_sections(course) for course in courses))
+    with span('section search', course_count=len(courses)):
+        # The search is CPU-bound; keep it off the event loop
+        result['schedules'], result['stats'] = await asyncio.to_thread(
+            optimize_sections, {c['course_id']: sections for c, sections in zip(courses, scored_sections)}, top_k)
+    print_progress(f"Found {len(result['schedules'])} conflict-free schedule(s) in {result['stats']['elapsed_ms']} ms "
+                   f"({result['stats']['leaves']} complete combinations evaluated)")
+    if result['stats']['truncated']:
+        print_progress("Search budget reached; these are the best schedules found so far.")
+    return result
+
+
+def print_optimized_schedules(result):
+    if not result['schedules']:
+        print("No conflict-free combination of sections was found.")
+    for schedule in result['schedules']:
+        print(f"\n#{schedule['rank']}  score {schedule['score']}/100 "
+              f"(professors {schedule['professor_score']}, balance {schedule['balance_score']})")
+        for section in schedule['sections']:
+            alternates = f" (same as {', '.join(section['alternate_sections'])})" if section['alternate_sections'] else ""
+            print(f"  {section['course_id']}-{section['section_id']}{alternates}: "
+                  f"{', '.join(section['instructors']) or 'Instructor TBA'} [{section['professor_score']}] - {section['schedule']}")
+        for note in schedule['balance_notes']:
+            print(f"    note: {note}")
+
 
 async def main():  # Make main async
     parser = argparse.ArgumentParser(
@@ -546,28 +1271,58 @@ async def main():  # Make main async
     parser.add_argument('--json', default='schedule_data.json',
                         help='JSON output file name')
     parser.add_argument('--api-key', help='Gemini API key')
+    parser.add_argument('--fast', action='store_true',
+                        help='Skip Gemini and score courses from review statistics only')
+    parser.add_argument('--no-tiering', action='store_true',
+                        help='Send every course summary to the full model (default: skip/lite/full by review evidence)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Save a Chrome-trace/Perfetto timeline next to the JSON output (<json>.trace.json)')
+    parser.add_argument('--profile-cpu', action='store_true',
+                        help='With --profile, also sample CPU stacks (<json>.cpu.folded)')
+    parser.add_argument('--optimize', nargs='+', metavar='COURSE_ID',
+                        help='Rank conflict-free section combinations for these course ids instead of analyzing a schedule')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                        help=f'Number of schedules --optimize returns (default: {DEFAULT_TOP_K})')
+    parser.add_argument('--cache', default=None,
+                        help='Cache backend: memory, sqlite:///path.db or redis://host:port/db (default: $TERPORACLE_CACHE or memory)')
     args = parser.parse_args()
 
     print("=" * 50 + "\nENHANCED UMD SCHEDULE ANALYZER (Async)\n" + "=" * 50)
 
+    if args.optimize:
+        # Section search needs no Gemini key: scores come from PlanetTerp ratings
+        configure_cache(args.cache)
+        try:
+            result = await optimize_schedule(args.optimize, args.term, args.top_k)
+        finally:
+            await close_http_client()
+            await close_cache()
+        print_optimized_schedules(result)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"JSON data saved to {args.json}")
+        return
+
     if not args.image_path and not args.courses_json:
         parser.error("Either image_path or --courses-json must be provided.")
     if args.image_path and not os.path.exists(args.image_path) and not args.courses_json:
         print(f"Error: Image file '{args.image_path}' not found.")
         sys.exit(1)
 
-    api_key = args.api_key or os.environ.get('GEMINI_API_KEY') or input(
-        "Enter your Gemini API key: ").strip()
-    if not api_key:
-        print("Error: Gemini API key is required.")
-        sys.exit(1)
+    api_key = args.api_key or os.environ.get('GEMINI_API_KEY')
+    # Fast mode only needs Gemini to read a schedule image
+    if not api_key and not (args.fast and args.courses_json):
+        api_key = input("Enter your Gemini API key: ").strip()
+        if not api_key:
+            print("Error: Gemini API key is required.")
+            sys.exit(1)
 
-    print_progress("Setting up Gemini API...")
-    models = setup_gemini_api(api_key)
+    models = None
+    if api_key:
+        print_progress("Setting up Gemini API...")
+        models = setup_gemini_api(api_key, {'enabled': False} if args.no_tiering else None)
 
     courses = []
-    processed_combinations = set()  # Keep track of processed course-section pairs
-
     if args.courses_json:
         print_progress("Using courses provided via --courses-json argument.")
         try:
@@ -578,33 +1333,17 @@ async def main():  # Make main async
                 if not isinstance(course, dict) or 'course_id' not in course or 'section' not in course:
                     raise ValueError(
                         "Each course object must have 'course_id' and 'section'.")
-                # Add check for duplicates before adding to the list to process
-                course_key = (course['course_id'].upper(),
-                              course['section'].strip().zfill(4))
-                if course_key not in processed_combinations:
-                    courses.append(course)
-                    processed_combinations.add(course_key)
-                else:
-                    print_progress(
-                        f"Skipping duplicate input: {course_key[0]}-{course_key[1]}")
+            courses = dedupe_courses(input_courses, "input")
             print_progress(
                 f"Processing {len(courses)} unique courses from JSON.")
         except (json.JSONDecodeError, ValueError) as e:
             print(f"Error parsing --courses-json: {e}")
             sys.exit(1)
     elif args.image_path:
-        extracted_courses = extract_courses_from_image(
+        extracted_courses = await extract_courses_from_image(
             args.image_path, models['vision_model'])
         if extracted_courses:
-            for course in extracted_courses:
-                course_key = (course['course_id'].upper(),
-                              course['section'].strip().zfill(4))
-                if course_key not in processed_combinations:
-                    courses.append(course)
-                    processed_combinations.add(course_key)
-                else:
-                    print_progress(
-                        f"Skipping duplicate extracted from image: {course_key[0]}-{course_key[1]}")
+            courses = dedupe_courses(extracted_courses, "extracted from image")
             print_progress(
                 f"Processing {len(courses)} unique courses from image.")
 
@@ -622,74 +1361,35 @@ async def main():  # Make main async
     for i, course in enumerate(courses, 1):
         print(f"{i}. {course['course_id']} Section {course['section']}")
 
-    # --- Gather Research Data Sequentially ---
-    research_tasks_data = []
-    print_progress("Gathering course and review data sequentially...")
-    for i, course in enumerate(courses, 1):
-        print("\n" + "=" * 30 + f" Researching Course {i}/{len(courses)}: {course['course_id']}-{course['section']} " + "=" * 30)
-        course_info = get_section_directly(course['course_id'], course['section'], args.term)
-        if not course_info:
-            print_progress(f"Could not find Testudo info. Trying PlanetTerp...")
-            course_info = {'course_id': course['course_id'], 'section_id': course['section'], 'instructors': ['Unknown']} # Minimal info
-
-        professors = course_info.get('instructors', [])
-        professor_to_analyze = 'Unknown' # Default
-        if professors and professors != ['Unknown']:
-             professor_to_analyze = professors[0] # Use first listed professor
-        else:
-             # Try PlanetTerp if Testudo failed or gave TBA
-             print_progress(f"Searching PlanetTerp for professors of {course['course_id']}...")
-             pt_profs = search_planetterp_professors(course['course_id'])
-             if pt_profs:
-                  professor_to_analyze = pt_profs[0] # Use first found from PlanetTerp
-                  print_progress(f"Found potential professor via PlanetTerp: {professor_to_analyze}")
-             else:
-                  print_progress(f"No professor found for {course['course_id']}. Cannot generate detailed analysis.")
-
-        if professor_to_analyze != 'Unknown':
-             # Store data needed for summary generation
-             research_data = research_professor_and_course(professor_to_analyze, course['course_id'], course_info)
-             research_tasks_data.append(research_data)
-        else:
-             # Append placeholder for courses without a professor
-             research_tasks_data.append({
-                 'course_id': course['course_id'], 'course_title': course_info.get('course_title', 'N/A'),
-                 'section_id': course['section'], 'professor': 'Unknown', 'schedule': 'N/A',
-                 'avg_rating': 0, 'review_count': 0, 'summary': 'Professor information unavailable. Cannot perform detailed analysis.',
-                 'research_stats': {}
-             })
-
-    # --- Generate Individual Summaries Concurrently ---
-    print("\n" + "=" * 50 + "\nGENERATING INDIVIDUAL COURSE SUMMARIES (CONCURRENTLY)\n" + "=" * 50)
-    summary_tasks = []
-    for data in research_tasks_data:
-        if data.get('professor') != 'Unknown': # Only generate summary if we have a professor
-             summary_tasks.append(
-                 # Create an awaitable task for each summary generation
-                 asyncio.create_task(generate_enhanced_course_summary(data, models['analysis_model']))
-             )
-        else:
-             # If professor was unknown, create a task that immediately returns the placeholder data
-             summary_tasks.append(asyncio.sleep(0, result=data)) # Use asyncio.sleep(0, result=...)
-
-    # Run tasks concurrently and gather results
-    # Results will be in the order the tasks were created
-    course_summaries = await asyncio.gather(*summary_tasks)
-
-    # Filter out potential None results if any task failed unexpectedly, though errors should be handled within generate_enhanced_course_summary
-    course_summaries = [s for s in course_summaries if s is not None]
+    configure_cache(args.cache)
+    profiler = start_profiling('cli', sample_cpu=args.profile_cpu) if args.profile or args.profile_cpu else None
+    llm_usage = {}
+    try:
+        course_summaries, overall_summary, schedule_metrics = await analyze_courses(
+            courses, args.term, models, fast=args.fast, llm_usage=llm_usage)
+    finally:
+        await close_http_client()
+        await close_gemini_clients()
+        await close_cache()
+        if profiler:
+            profiler.stop()
+            profile_base = os.path.splitext(args.json)[0]
+            profile_paths = profiler.save(f"{profile_base}.trace.json", f"{profile_base}.cpu.folded")
+            print_progress(f"Profile saved: {', '.join(profile_paths.values())} (open the trace in ui.perfetto.dev)")
+            for frame, count in profiler.hot_spots():
+                print_progress(f"  {count:>5} samples  {frame}")
 
     if not course_summaries: print_progress("No course summaries generated."); sys.exit(1)
 
-    # --- Generate Overall Summary Sequentially (after individuals are done) ---
-    print("\n" + "=" * 50 + "\nGENERATING OVERALL SCHEDULE ANALYSIS\n" + "=" * 50)
-    overall_summary = await generate_overall_schedule_summary(course_summaries, models['analysis_model']) # Await the async function
-
     # --- Export Results ---
-    export_to_file(course_summaries, overall_summary, args.output)
-    export_to_json(course_summaries, overall_summary, args.json)
-
-    print("\nEnhanced analysis complete! ✅")
+    export_to_file(course_summaries, overall_summary, args.output, schedule_metrics)
+    export_to_json(course_summaries, overall_summary, args.json, schedule_metrics, mode='fast' if args.fast else 'full',
+                   llm_usage=llm_usage)
+    for tier, stats in llm_usage.items():
+        print_progress(f"LLM {tier}: {stats['courses']} course(s), {stats['calls']} call(s), {stats['cache_hits']} cached, "
+                       f"{stats['latency_ms']:.0f} ms, {stats['total_tokens']} tokens" + (f" ({stats['model']})" if stats['model'] else ""))
+
+    print(f"\n{'Fast' if args.fast else 'Enhanced'} analysis complete! ✅")
     print(f"Results saved to {args.output}")
     print(f"JSON data saved to {args.json}")
 
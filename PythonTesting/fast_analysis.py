@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""LLM-free schedule analysis computed directly from PlanetTerp research data.
+
+Used for `--fast` / `mode=fast`: every score is derived from vectorized
+review aggregates and the schedule-structure metrics, so results come back
+in well under a second and never depend on Gemini being available.
+"""
+import time
+import numpy as np
+
+from review_store import ReviewStore
+from schedule_grid import format_schedule_metrics, parse_time
+
+# Reviews lose half their weight every two years
+RECENCY_HALF_LIFE_DAYS = 730
+# Pseudo-count of neutral (50/100) evidence a course score is shrunk toward
+PRIOR_STRENGTH = 5
+NEUTRAL_SCORE = 50
+
+GRADE_POINTS = {'A+': 4.0, 'A': 4.0, 'A-': 3.7, 'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+                'C+': 2.3, 'C': 2.0, 'C-': 1.7, 'D+': 1.3, 'D': 1.0, 'D-': 0.7, 'F': 0.0}
+
+# Schedule-balance deductions (score_schedule_balance)
+CONFLICT_PENALTY = 30
+LONG_GAP_MINUTES = 120
+LONG_GAP_PENALTY = 3
+EARLY_START_MINUTE = 9 * 60
+EARLY_START_PENALTY = 3
+LONG_DAY_MINUTES = 300
+LONG_DAY_PENALTY = 5
+BACK_TO_BACK_RUN = 3
+BACK_TO_BACK_PENALTY = 4
+
+# Weight of each research bucket when blending into a course score
+BUCKET_WEIGHTS = {'direct_reviews': 1.0, 'professor_other_reviews': 0.5, 'course_other_reviews': 0.25}
+
+
+def compute_review_stats(reviews, today=None):
+    """Vectorized aggregates over a ReviewStore (or a list of PlanetTerp review dicts)."""
+    if not isinstance(reviews, ReviewStore):
+        reviews = ReviewStore.from_reviews(reviews or [])
+    today = np.datetime64(today or time.strftime('%Y-%m-%d'), 'D')
+    return aggregate_review_columns(reviews.ratings.astype(np.float64), reviews.dates, reviews.grade_labels(), today)
+
+
+def aggregate_review_columns(ratings, dates, grades, today):
+    """Aggregate rating/date/grade columns into the fast-mode statistics dict."""
+    rated = ~np.isnan(ratings)
+    undated = np.isnat(dates)
+    age_days = np.where(undated, 0, (today - dates).astype(np.int64)).astype(np.float64)
+    # Undated reviews get the weight of a review one half-life old
+    age_days = np.where(undated, RECENCY_HALF_LIFE_DAYS, np.clip(age_days, 0, None))
+    weights = np.power(0.5, age_days / RECENCY_HALF_LIFE_DAYS) * rated
+    weight_total = weights.sum()
+    weighted_mean = float(np.dot(np.nan_to_num(ratings), weights) / weight_total) if weight_total > 0 else None
+    mean = float(ratings[rated].mean()) if rated.any() else None
+
+    histogram = np.bincount(np.clip(ratings[rated], 1, 5).round().astype(np.int64), minlength=6)[1:]
+
+    labels, counts = np.unique(grades[grades != ''], return_counts=True)
+    known = np.isin(grades, list(GRADE_POINTS))
+    grade_points = np.array([GRADE_POINTS[g] for g in grades[known]], dtype=np.float64)
+
+    valid_dates = dates[~undated]
+    return {
+        'review_count': int(len(ratings)),
+        'rated_count': int(rated.sum()),
+        'mean_rating': round(mean, 3) if mean is not None else None,
+        'recency_weighted_rating': round(weighted_mean, 3) if weighted_mean is not None else None,
+        'effective_review_weight': round(float(weight_total), 3),
+        'rating_histogram': {str(star): int(count) for star, count in zip(range(1, 6), histogram)},
+        'expected_grade_distribution': {str(label): int(count) for label, count in zip(labels, counts)},
+        'expected_gpa': round(float(grade_points.mean()), 2) if grade_points.size else None,
+        'graded_count': int(grade_points.size),
+        'newest_review': str(valid_dates.max()) if valid_dates.size else None,
+        'oldest_review': str(valid_dates.min()) if valid_dates.size else None,
+    }
+
+
+def shrink_to_neutral(score, weight):
+    """Pull a 0-100 score toward neutral by PRIOR_STRENGTH pseudo-reviews."""
+    return (score * weight + NEUTRAL_SCORE * PRIOR_STRENGTH) / (weight + PRIOR_STRENGTH)
+
+
+def rating_to_score(rating, weight):
+    """Map a 1-5 rating to 0-100, shrunk toward neutral when evidence is thin."""
+    if rating is None or weight <= 0:
+        return NEUTRAL_SCORE
+    return shrink_to_neutral((rating - 1) / 4 * 100, weight)
+
+
+def score_reviews(reviews):
+    """0-100 professor score from one set of reviews (recency-weighted, shrunk toward neutral)."""
+    stats = compute_review_stats(reviews)
+    return rating_to_score(stats['recency_weighted_rating'], stats['effective_review_weight'])
+
+
+def score_course(research_data):
+    """Compute per-bucket stats and blended fast-mode scores for one course."""
+    bucket_stats = {bucket: compute_review_stats(research_data.get(bucket, ReviewStore.empty()))
+                    for bucket in BUCKET_WEIGHTS}
+    weights = np.array([bucket_stats[b]['effective_review_weight'] * w for b, w in BUCKET_WEIGHTS.items()])
+    ratings = np.array([bucket_stats[b]['recency_weighted_rating'] or 0 for b in BUCKET_WEIGHTS])
+    total_weight = weights.sum()
+    blended_rating = float(np.dot(ratings, weights) / total_weight) if total_weight > 0 else None
+    professor_score = rating_to_score(blended_rating, total_weight)
+
+    # Grade outlook only uses reviews of this course (any professor), shrunk
+    # toward neutral by how many of them reported a grade
+    grade_buckets = ('direct_reviews', 'course_other_reviews')
+    gpas = [bucket_stats[b]['expected_gpa'] for b in grade_buckets if bucket_stats[b]['expected_gpa'] is not None]
+    graded_count = sum(bucket_stats[b]['graded_count'] for b in grade_buckets)
+    expected_gpa = float(np.mean(gpas)) if gpas else None
+    grade_score = shrink_to_neutral(expected_gpa / 4 * 100, graded_count) if expected_gpa is not None else NEUTRAL_SCORE
+
+    return {
+        'professor_score': round(professor_score),
+        'grade_outlook_score': round(grade_score),
+        'blended_rating': round(blended_rating, 2) if blended_rating is not None else None,
+        'expected_gpa': round(expected_gpa, 2) if expected_gpa is not None else None,
+        'evidence_weight': round(float(total_weight), 2),
+        'buckets': bucket_stats,
+    }
+
+
+def score_schedule_balance(schedule_metrics):
+    """Deduct from 100 for conflicts, long gaps, early starts, overloaded days and long runs."""
+    if not schedule_metrics or not schedule_metrics.get('days'):
+        return NEUTRAL_SCORE, ["No fixed meeting times available."]
+    score = 100
+    notes = []
+    if schedule_metrics['conflicts']:
+        score -= CONFLICT_PENALTY * len(schedule_metrics['conflicts'])
+        notes.append(f"{len(schedule_metrics['conflicts'])} time conflict(s).")
+    for day, info in schedule_metrics['days'].items():
+        long_gaps = [g for g in info['gaps'] if g['minutes'] >= LONG_GAP_MINUTES]
+        if long_gaps:
+            score -= LONG_GAP_PENALTY * len(long_gaps)
+            notes.append(f"{day}: {len(long_gaps)} gap(s) of 2+ hours.")
+        if parse_time(info['earliest_start']) < EARLY_START_MINUTE:
+            score -= EARLY_START_PENALTY
+            notes.append(f"{day}: starts before 9:00am.")
+        if info['class_minutes'] > LONG_DAY_MINUTES:
+            score -= LONG_DAY_PENALTY
+            notes.append(f"{day}: over 5 hours in class.")
+        if any(run >= BACK_TO_BACK_RUN for run in info['back_to_back_runs']):
+            score -= BACK_TO_BACK_PENALTY
+            notes.append(f"{day}: 3+ classes back-to-back.")
+    return max(0, min(100, score)), notes
+
+
+def build_fast_course_summary(research_data):
+    """Build a course summary dict in the same shape as generate_enhanced_course_summary."""
+    summary = {
+        'course_id': research_data.get('course_id', ''), 'course_title': research_data.get('course_title', ''),
+        'section_id': research_data.get('section_id', ''), 'professor': research_data.get('professor', 'Unknown'),
+        'schedule': research_data.get('schedule', ''), 'meetings': research_data.get('meetings', []),
+        'avg_rating': research_data.get('avg_rating', 0), 'review_count': research_data.get('review_count', 0),
+    }
+    if research_data.get('professor', 'Unknown') == 'Unknown':
+        summary['summary'] = research_data.get('summary', 'Professor information unavailable. Cannot perform detailed analysis.')
+        summary['research_stats'] = research_data.get('research_stats', {})
+        summary['fast_stats'] = None
+        return summary
+
+    stats = score_course(research_data)
+    direct = stats['buckets']['direct_reviews']
+    histogram = ", ".join(f"{star}★ {count}" for star, count in direct['rating_histogram'].items())
+    grades = ", ".join(f"{g}: {c}" for g, c in direct['expected_grade_distribution'].items()) or "none reported"
+    summary['summary'] = "\n".join([
+        f"**Professor Rating Score: {stats['professor_score']}/100** "
+        f"(recency-weighted rating {stats['blended_rating'] if stats['blended_rating'] is not None else 'N/A'}/5, "
+        f"evidence weight {stats['evidence_weight']})",
+        f"**Grade Outlook: {stats['grade_outlook_score']}/100** "
+        f"(expected GPA {stats['expected_gpa'] if stats['expected_gpa'] is not None else 'N/A'})",
+        f"Direct reviews: {direct['review_count']} ({histogram}); expected grades: {grades}.",
+        f"Other courses by this professor: {stats['buckets']['professor_other_reviews']['review_count']} reviews; "
+        f"this course with other professors: {stats['buckets']['course_other_reviews']['review_count']} reviews.",
+        "",
+        "_Quick estimate computed from review statistics; no AI analysis was used._",
+    ])
+    summary['research_stats'] = research_data
+    summary['fast_stats'] = stats
+    return summary
+
+
+def build_fast_overall_summary(course_summaries, schedule_metrics):
+    """Build overall analysis text (with the grade line) from fast course summaries."""
+    scored = [s['fast_stats'] for s in course_summaries if s.get('fast_stats')]
+    professor_quality = round(np.mean([s['professor_score'] for s in scored])) if scored else NEUTRAL_SCORE
+    grade_outlook = round(np.mean([s['grade_outlook_score'] for s in scored])) if scored else NEUTRAL_SCORE
+    balance, balance_notes = score_schedule_balance(schedule_metrics)
+    overall = round(0.5 * professor_quality + 0.3 * balance + 0.2 * grade_outlook)
+    return "\n".join([
+        f"Overall Schedule Grade: {overall}/100",
+        "",
+        f"**Professor Quality: {professor_quality}/100** - recency-weighted PlanetTerp ratings across {len(scored)} course(s).",
+        f"**Schedule Balance: {balance}/100** - {' '.join(balance_notes) or 'No structural issues found.'}",
+        f"**Difficulty Management: {grade_outlook}/100** - based on students' expected grades.",
+        "",
+        "**Schedule Structure:**",
+        format_schedule_metrics(schedule_metrics),
+        "",
+        "_Quick estimate computed from review statistics; no AI analysis was used._",
+    ])
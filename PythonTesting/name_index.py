@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Resolve Testudo instructor names to PlanetTerp professor names.
+
+Testudo and PlanetTerp format names differently (middle initials, accents,
+nicknames, hyphenated surnames), and PlanetTerp's /v1/professor endpoint
+only accepts its own spelling. A ProfessorNameIndex is built in memory from
+the professors PlanetTerp lists for a course and matches names by
+normalized tokens first, then by trigram Jaccard similarity. Confident
+non-exact resolutions (not fuzzy ones) are remembered in a small JSON alias
+table (professor_aliases.json, or $TERPORACLE_ALIASES) that can also be
+edited by hand to pin a mapping. Writes hold an exclusive lock on
+<table>.lock (where fcntl is available) so workers sharing the file don't
+drop each other's aliases.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, writes still merge
+    fcntl = None
+
+ALIAS_PATH = os.environ.get(
+    'TERPORACLE_ALIASES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'professor_aliases.json'))
+
+# Fuzzy matches below this trigram Jaccard score are rejected
+MIN_FUZZY_SCORE = 0.55
+# ...as are fuzzy matches that barely beat the runner-up
+MIN_FUZZY_MARGIN = 0.1
+# Only matches at least this confident are remembered in the alias table;
+# fuzzy matches are used for the lookup at hand but never persisted
+MIN_ALIAS_SCORE = 0.9
+
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'phd', 'md', 'dr', 'prof', 'professor'}
+PLACEHOLDER_NAMES = {'', 'tba', 'staff', 'unknown', 'instructor tba'}
+NICKNAMES = {
+    'al': 'albert', 'alex': 'alexander', 'andy': 'andrew', 'ben': 'benjamin', 'bill': 'william',
+    'bob': 'robert', 'chris': 'christopher', 'dan': 'daniel', 'dave': 'david', 'ed': 'edward',
+    'greg': 'gregory', 'jim': 'james', 'joe': 'joseph', 'jon': 'jonathan', 'kate': 'katherine',
+    'larry': 'lawrence', 'liz': 'elizabeth', 'matt': 'matthew', 'mike': 'michael', 'nick': 'nicholas',
+    'pat': 'patrick', 'rob': 'robert', 'sam': 'samuel', 'steve': 'steven', 'tom': 'thomas',
+    'tony': 'anthony', 'will': 'william',
+}
+
+
+def name_tokens(name):
+    """Normalized name tokens: no accents, punctuation, suffixes or middle initials; nicknames expanded."""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"['’.]", "", text)
+    tokens = [t for t in re.split(r"[^a-z]+", text) if t and t not in NAME_SUFFIXES]
+    if len(tokens) > 2:
+        # Keep first and last names; drop middle initials
+        tokens = [tokens[0]] + [t for t in tokens[1:-1] if len(t) > 1] + [tokens[-1]]
+    return tuple(NICKNAMES.get(t, t) if i == 0 else t for i, t in enumerate(tokens))
+
+
+def name_key(name):
+    return " ".join(name_tokens(name))
+
+
+def is_placeholder_name(name):
+    """True for Testudo placeholders like 'TBA' or 'Staff'."""
+    return name_key(name) in PLACEHOLDER_NAMES
+
+
+def compatible_first_names(a, b):
+    """True if two first-name tokens can be the same person: equal, an initial of the other, or a prefix of it."""
+    if not a or not b:
+        return False
+    if len(a) == 1 or len(b) == 1:
+        return a[0] == b[0]
+    return a.startswith(b) or b.startswith(a)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class ProfessorNameIndex:
+    """In-memory index over one set of PlanetTerp professor names."""
+
+    def __init__(self, names):
+        self.names = sorted(set(n for n in names if n))
+        self.tokens = [name_tokens(name) for name in self.names]
+        self.by_key = {}
+        self.by_first_last = {}
+        self.by_last = {}
+        self.trigram_sets = []
+        self.postings = {}
+        for name_id, tokens in enumerate(self.tokens):
+            key = " ".join(tokens)
+            self.by_key.setdefault(key, name_id)
+            if tokens:
+                self.by_first_last.setdefault((tokens[0], tokens[-1]), []).append(name_id)
+                self.by_last.setdefault(tokens[-1], []).append(name_id)
+            grams = trigrams(key)
+            self.trigram_sets.append(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(name_id)
+
+    def resolve(self, name):
+        """Return (planetterp_name, score) for the best unambiguous match, or (None, 0.0)."""
+        tokens = name_tokens(name)
+        if not tokens:
+            return None, 0.0
+        key = " ".join(tokens)
+        if key in self.by_key:
+            return self.names[self.by_key[key]], 1.0
+        first_last = self.by_first_last.get((tokens[0], tokens[-1]), [])
+        if len(first_last) == 1:
+            return self.names[first_last[0]], 0.95
+        # Same surname and a compatible first name ("J Smith" or "Jen Smith" vs "Jennifer Smith",
+        # but never "John Smith" vs "Jane Smith")
+        compatible = [i for i in self.by_last.get(tokens[-1], [])
+                      if compatible_first_names(self.tokens[i][0], tokens[0])]
+        if len(compatible) == 1:
+            return self.names[compatible[0]], 0.9
+
+        # Trigram Jaccard over candidates sharing at least one trigram; a
+        # candidate with our exact surname but a different first name is
+        # another person, not a spelling variant
+        grams = trigrams(key)
+        candidates = {name_id for gram in grams for name_id in self.postings.get(gram, ())
+                      if self.tokens[name_id][-1] != tokens[-1]}
+        scored = sorted(((jaccard(grams, self.trigram_sets[i]), i) for i in candidates), reverse=True)
+        if not scored or scored[0][0] < MIN_FUZZY_SCORE:
+            return None, 0.0
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < MIN_FUZZY_MARGIN:
+            return None, 0.0
+        return self.names[scored[0][1]], round(scored[0][0], 3)
+
+
+@lru_cache(maxsize=256)
+def _cached_index(names):
+    return ProfessorNameIndex(names)
+
+
+def build_index(names):
+    """Index for a list of PlanetTerp names (memoized, since course lists repeat)."""
+    return _cached_index(tuple(sorted(set(n for n in names if n))))
+
+
+class AliasTable:
+    """Persisted Testudo-name -> PlanetTerp-name mappings, keyed by name_key()."""
+
+    def __init__(self, path=ALIAS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._aliases = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, name):
+        return self._aliases.get(name_key(name))
+
+    def add(self, name, planetterp_name):
+        """Remember a mapping and persist it (merging with aliases other processes wrote).
+
+        Blocks on file I/O; async callers should run it via asyncio.to_thread.
+        """
+        key = name_key(name)
+        if not key or self._aliases.get(key) == planetterp_name:
+            return
+        with self._lock:
+            try:
+                with open(f"{self.path}.lock", 'a') as lock_file:
+                    if fcntl:
+                        # Held from read to replace, so no other worker's alias is lost in between
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    aliases = self._read()
+                    aliases.update(self._aliases)
+                    aliases[key] = planetterp_name
+                    self._aliases = aliases
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(aliases, f, indent=2, sort_keys=True)
+                    os.replace(tmp_path, self.path)
+            except OSError as e:
+                self._aliases = {**self._aliases, key: planetterp_name}
+                print(f"[*] Warning: could not save professor aliases to {self.path}: {e}")
+
+
+_alias_table = None
+
+
+def get_alias_table():
+    global _alias_table
+    if _alias_table is None:
+        _alias_table = AliasTable()
+    return _alias_table
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Timeline profiling for an analysis run (--profile / ?profile=1).
+
+Spans are recorded as Chrome trace "complete" events, so the saved
+.trace.json opens directly in Perfetto (ui.perfetto.dev) or
+chrome://tracing. Every asyncio task gets its own lane (tid), which makes
+concurrent research and Gemini calls show up side by side; work pushed to
+threads (HTML parsing) gets a lane per thread.
+
+The active profiler lives in a context variable, so concurrent web
+requests profile independently and span() is a no-op when profiling is off.
+Optional CPU sampling walks every thread's stack at a fixed interval and
+writes collapsed stacks (.cpu.folded) for flamegraph.pl or speedscope.
+Samples cover the whole process, so in the web server they include any
+requests that ran concurrently with the profiled one.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_active_profiler = contextvars.ContextVar('terporacle_profiler', default=None)
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+class Profiler:
+    """Collects trace events (and optionally CPU samples) for one analysis."""
+
+    def __init__(self, name='analysis', sample_cpu=False, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.name = name
+        self.pid = os.getpid()
+        self.events = []
+        self.samples = Counter()
+        self.sample_cpu = sample_cpu
+        self.sample_interval = sample_interval
+        self._origin = time.perf_counter()
+        self._lanes = {}
+        self._lanes_lock = threading.Lock()
+        self._token = None
+        self._sampler = None
+        self._sampling = threading.Event()
+
+    def now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def lane(self):
+        """Trace tid for the current asyncio task, or the current thread outside the loop."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, label = task, f"task: {task.get_name()}"
+        else:
+            thread = threading.current_thread()
+            key, label = ('thread', thread.ident), f"thread: {thread.name}"
+        with self._lanes_lock:
+            tid = self._lanes.get(key)
+            if tid is None:
+                tid = len(self._lanes) + 1
+                self._lanes[key] = tid
+                self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                                    "args": {"name": label}})
+        return tid
+
+    def add_span(self, name, category, start_us, end_us, tid, args):
+        self.events.append({"name": name, "cat": category, "ph": "X", "ts": round(start_us, 1),
+                            "dur": round(end_us - start_us, 1), "pid": self.pid, "tid": tid, "args": args})
+
+    def start(self):
+        self._token = _active_profiler.set(self)
+        if self.sample_cpu:
+            self._sampling.set()
+            self._sampler = threading.Thread(target=self._sample_loop, name='cpu-sampler', daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampling.clear()
+            self._sampler.join()
+            self._sampler = None
+        if self._token is not None:
+            _active_profiler.reset(self._token)
+            self._token = None
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while self._sampling.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.sample_interval)
+
+    def hot_spots(self, limit=10):
+        """Functions with the most self samples (leaf frames), as (frame, count) pairs."""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def save(self, trace_path, folded_path=None):
+        """Write the trace (and CPU samples, if collected); return the paths written."""
+        trace = {"traceEvents": [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                                  "args": {"name": f"terporacle {self.name}"}}] + self.events,
+                 "displayTimeUnit": "ms"}
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+        paths = {'trace': trace_path}
+        if self.sample_cpu and folded_path:
+            with open(folded_path, 'w', encoding='utf-8') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths['cpu'] = folded_path
+        return paths
+
+
+def start_profiling(name='analysis', sample_cpu=False):
+    """Create a profiler and make it active for the current context."""
+    return Profiler(name, sample_cpu=sample_cpu).start()
+
+
+@contextmanager
+def span(name, category='stage', **args):
+    """Record a timeline span in the active profiler (no-op when profiling is off)."""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    tid = profiler.lane()
+    start = profiler.now_us()
+    try:
+        yield
+    finally:
+        profiler.add_span(name, category, start, profiler.now_us(), tid, args)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Columnar storage for PlanetTerp reviews.
+
+PlanetTerp returns reviews as a list of dicts, and the research steps used
+to filter and re-filter those lists with comprehensions. A ReviewStore keeps
+the same data as parallel NumPy columns instead: ratings, dates, interned
+course/professor/grade ids and (start, end) offsets into one shared text
+buffer. Filters become boolean masks and selections share the text buffer,
+so narrowing a store never copies review text.
+"""
+import numpy as np
+
+# Process-wide intern table for course codes, professor names and grades.
+# Ids are stable for the life of the process, so masks built from one
+# store can be compared against any other store.
+_interned_strings = []
+_intern_ids = {}
+MISSING_ID = -1
+
+
+def intern_string(value):
+    """Return the stable int id for a string (MISSING_ID for None/empty)."""
+    if not value:
+        return MISSING_ID
+    string_id = _intern_ids.get(value)
+    if string_id is None:
+        string_id = len(_interned_strings)
+        _interned_strings.append(value)
+        _intern_ids[value] = string_id
+    return string_id
+
+
+def lookup_string(string_id):
+    """Return the string for an interned id (None for MISSING_ID)."""
+    return _interned_strings[string_id] if string_id != MISSING_ID else None
+
+
+def lookup_id(value):
+    """Return the id of an already interned string without interning it."""
+    return _intern_ids.get(value, MISSING_ID) if value else MISSING_ID
+
+
+def parse_review_date(created):
+    """Day of a review's 'created' timestamp (NaT if missing or malformed)."""
+    try:
+        return np.datetime64(str(created)[:10], 'D') if created else np.datetime64('NaT', 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+class ReviewStore:
+    """Immutable columnar set of PlanetTerp reviews."""
+
+    __slots__ = ('ratings', 'dates', 'course_ids', 'professor_ids', 'grade_ids',
+                 'text', 'text_starts', 'text_ends')
+
+    def __init__(self, ratings, dates, course_ids, professor_ids, grade_ids, text, text_starts, text_ends):
+        self.ratings = ratings
+        self.dates = dates
+        self.course_ids = course_ids
+        self.professor_ids = professor_ids
+        self.grade_ids = grade_ids
+        self.text = text
+        self.text_starts = text_starts
+        self.text_ends = text_ends
+
+    @classmethod
+    def empty(cls):
+        return cls.from_reviews([])
+
+    @classmethod
+    def from_reviews(cls, reviews, professor=None):
+        """Build a store from PlanetTerp review dicts.
+
+        `professor` fills in the professor column for endpoints (like
+        /v1/professor) whose reviews omit it.
+        """
+        default_professor_id = intern_string(professor)
+        texts = [review.get("review") or "" for review in reviews]
+        text_ends = np.cumsum([len(review_text) for review_text in texts], dtype=np.int64)
+        text_starts = text_ends - np.array([len(review_text) for review_text in texts], dtype=np.int64)
+        return cls(
+            np.array([review.get("rating") for review in reviews], dtype=np.float32),
+            np.array([parse_review_date(review.get("created")) for review in reviews], dtype='datetime64[D]'),
+            np.array([intern_string(review.get("course")) for review in reviews], dtype=np.int32),
+            np.array([intern_string(review.get("professor")) if review.get("professor") else default_professor_id
+                      for review in reviews], dtype=np.int32),
+            np.array([intern_string(review.get("expected_grade") or review.get("grade")) for review in reviews],
+                     dtype=np.int32),
+            "".join(texts), text_starts, text_ends)
+
+    @classmethod
+    def concat(cls, stores):
+        """Concatenate stores into one (review text is copied into a new buffer)."""
+        stores = [store for store in stores if len(store)]
+        if not stores:
+            return cls.empty()
+        if len(stores) == 1:
+            return stores[0]
+        texts = []
+        ends = []
+        offset = 0
+        for store in stores:
+            lengths = store.text_ends - store.text_starts
+            ends.append(offset + np.cumsum(lengths))
+            offset += int(lengths.sum())
+            texts.extend(store.text[start:end] for start, end in zip(store.text_starts, store.text_ends))
+        text_ends = np.concatenate(ends)
+        text_starts = np.concatenate(([0], text_ends[:-1])).astype(np.int64)
+        return cls(np.concatenate([s.ratings for s in stores]), np.concatenate([s.dates for s in stores]),
+                   np.concatenate([s.course_ids for s in stores]), np.concatenate([s.professor_ids for s in stores]),
+                   np.concatenate([s.grade_ids for s in stores]), "".join(texts), text_starts, text_ends)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def select(self, selector):
+        """Return a new store with the rows picked by a boolean mask, index array or slice."""
+        return ReviewStore(self.ratings[selector], self.dates[selector], self.course_ids[selector],
+                           self.professor_ids[selector], self.grade_ids[selector], self.text,
+                           self.text_starts[selector], self.text_ends[selector])
+
+    def head(self, count):
+        return self.select(slice(0, count))
+
+    def for_course(self, course_id):
+        """Reviews of a single course."""
+        string_id = lookup_id(course_id)
+        if string_id == MISSING_ID:
+            return self.select(slice(0, 0))
+        return self.select(self.course_ids == string_id)
+
+    def for_professor(self, professor):
+        """Reviews of a single professor."""
+        string_id = lookup_id(professor)
+        if string_id == MISSING_ID:
+            return self.select(slice(0, 0))
+        return self.select(self.professor_ids == string_id)
+
+    def excluding_course(self, course_id):
+        """Reviews of any other (known) course."""
+        return self.select((self.course_ids != lookup_id(course_id)) & (self.course_ids != MISSING_ID))
+
+    def for_courses(self, course_ids):
+        """Reviews of any course in `course_ids`."""
+        wanted = [lookup_id(c) for c in course_ids]
+        return self.select(np.isin(self.course_ids, [i for i in wanted if i != MISSING_ID]))
+
+    def course_codes(self):
+        """Sorted list of distinct known course codes."""
+        unique_ids = np.unique(self.course_ids)
+        return sorted(lookup_string(i) for i in unique_ids if i != MISSING_ID)
+
+    def rated_count(self):
+        return int(np.count_nonzero(~np.isnan(self.ratings)))
+
+    def mean_rating(self):
+        """Mean of the non-missing ratings (0 when there are none)."""
+        rated = self.ratings[~np.isnan(self.ratings)]
+        return float(rated.mean()) if rated.size else 0
+
+    def grade_labels(self):
+        """Expected-grade column as an object array of strings ('' when missing)."""
+        unique_ids, inverse = np.unique(self.grade_ids, return_inverse=True)
+        labels = np.array([lookup_string(i) or '' for i in unique_ids], dtype=object)
+        return labels[inverse.reshape(-1)]
+
+    def review_text(self, index):
+        return self.text[self.text_starts[index]:self.text_ends[index]]
+
+    def iter_rows(self):
+        """Yield one dict per review (only materialize rows that are actually needed)."""
+        for i in range(len(self)):
+            rating = self.ratings[i]
+            date = self.dates[i]
+            yield {
+                "course": lookup_string(self.course_ids[i]),
+                "professor": lookup_string(self.professor_ids[i]),
+                "rating": None if np.isnan(rating) else int(rating) if rating.is_integer() else float(rating),
+                "expected_grade": lookup_string(self.grade_ids[i]) or "",
+                "review": self.review_text(i),
+                "created": "" if np.isnat(date) else str(date),
+            }
+
+    def to_records(self):
+        """JSON-serializable list of PlanetTerp-shaped review dicts."""
+        return list(self.iter_rows())
+
+    def nbytes(self):
+        """Approximate memory footprint of the columns and text buffer."""
+        columns = (self.ratings, self.dates, self.course_ids, self.professor_ids, self.grade_ids,
+                   self.text_starts, self.text_ends)
+        return sum(column.nbytes for column in columns) + len(self.text.encode('utf-8'))
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Deterministic schedule-structure metrics for Testudo meeting times.
+
+Each course's meetings are folded into one bitset per weekday, where bit N
+means "in class during minute N after midnight". Conflicts, gaps, daily
+load and back-to-back runs then fall out of a handful of integer AND/OR
+and popcount operations instead of any string comparisons.
+"""
+import re
+
+DAY_ORDER = ['M', 'Tu', 'W', 'Th', 'F', 'Sa', 'Su']
+DAY_NAMES = {'M': 'Monday', 'Tu': 'Tuesday', 'W': 'Wednesday', 'Th': 'Thursday',
+             'F': 'Friday', 'Sa': 'Saturday', 'Su': 'Sunday'}
+MINUTES_PER_DAY = 24 * 60
+
+# Gaps at or below this many minutes count as "back-to-back" (Testudo's
+# standard passing period is 10 minutes, e.g. 10:50am -> 11:00am)
+BACK_TO_BACK_MAX_GAP = 15
+
+_DAY_TOKEN_RE = re.compile(r'Tu|Th|Sa|Su|M|W|F')
+_TIME_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*([ap])\.?m?\.?\s*$', re.IGNORECASE)
+
+
+def parse_days(days_str):
+    """Parse a Testudo day string like 'MWF' or 'TuTh' into day codes."""
+    if not days_str:
+        return []
+    days = []
+    for token in _DAY_TOKEN_RE.findall(days_str):
+        if token not in days:
+            days.append(token)
+    return days
+
+
+def parse_time(time_str):
+    """Parse '10:00am' into minutes after midnight, or None if unparseable."""
+    if not time_str:
+        return None
+    match = _TIME_RE.match(time_str)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3).lower()
+    if hour == 12:
+        hour = 0
+    if meridiem == 'p':
+        hour += 12
+    return hour * 60 + minute
+
+
+def format_minutes(minutes):
+    """Format minutes after midnight as Testudo-style '10:00am'."""
+    hour, minute = divmod(minutes, 60)
+    meridiem = 'am' if hour < 12 else 'pm'
+    hour = hour % 12 or 12
+    return f"{hour}:{minute:02d}{meridiem}"
+
+
+def meeting_block(meeting):
+    """Return (days, start, end) for a meeting dict, or None if it has no fixed time."""
+    days = parse_days(meeting.get('days', ''))
+    start = parse_time(meeting.get('start', ''))
+    end = parse_time(meeting.get('end', ''))
+    if not days or start is None or end is None or end <= start:
+        return None
+    return days, start, end
+
+
+def build_day_masks(meetings):
+    """Fold a list of meeting dicts into {day: bitset} (bit N = minute N busy)."""
+    masks = {}
+    for meeting in meetings or []:
+        block = meeting_block(meeting)
+        if not block:
+            continue
+        days, start, end = block
+        span = ((1 << (end - start)) - 1) << start
+        for day in days:
+            masks[day] = masks.get(day, 0) | span
+    return masks
+
+
+def build_week_mask(meetings):
+    """Fold a list of meeting dicts into one int for the whole week (day i uses bits i*1440 .. i*1440+1439)."""
+    week = 0
+    for day, mask in build_day_masks(meetings).items():
+        week |= mask << (DAY_ORDER.index(day) * MINUTES_PER_DAY)
+    return week
+
+
+def iter_runs(mask):
+    """Yield (start, end) minute ranges for each contiguous run of set bits."""
+    while mask:
+        start = (mask & -mask).bit_length() - 1
+        shifted = mask >> start
+        length = (~shifted & (shifted + 1)).bit_length() - 1
+        yield start, start + length
+        mask &= ~(((1 << length) - 1) << start)
+
+
+def meetings_from_course_info(course_info):
+    """Return the meeting list for a Testudo course_info dict.
+
+    Falls back to the legacy single 'days'/'time' fields when no parsed
+    'meetings' list is present.
+    """
+    if not course_info:
+        return []
+    if course_info.get('meetings'):
+        return course_info['meetings']
+    time_str = course_info.get('time', '')
+    if ' - ' not in time_str:
+        return []
+    start, end = [part.strip() for part in time_str.split(' - ', 1)]
+    return [{'type': 'Lecture', 'days': course_info.get('days', ''), 'start': start, 'end': end}]
+
+
+def format_meetings(meetings):
+    """Human-readable schedule string, e.g. 'MWF 10:00am - 10:50am; Th 2:00pm - 2:50pm (Discussion)'."""
+    parts = []
+    for meeting in meetings or []:
+        text = f"{meeting.get('days', '')} {meeting.get('start', '')} - {meeting.get('end', '')}".strip()
+        if text == '-':
+            continue
+        meeting_type = meeting.get('type', '')
+        if meeting_type and meeting_type != 'Lecture':
+            text += f" ({meeting_type})"
+        parts.append(text)
+    return "; ".join(parts)
+
+
+def compute_schedule_metrics(courses):
+    """Compute exact schedule-structure metrics for a list of courses.
+
+    `courses` is a list of dicts with at least 'course_id' and 'meetings'
+    (as produced by get_section_directly). Returns a JSON-serializable dict.
+    """
+    course_masks = []
+    unscheduled = []
+    for course in courses:
+        label = course.get('course_id', 'Unknown')
+        if course.get('section_id'):
+            label += f"-{course['section_id']}"
+        masks = build_day_masks(course.get('meetings', []))
+        if masks:
+            course_masks.append((label, masks))
+        else:
+            unscheduled.append(label)
+
+    conflicts = []
+    for i in range(len(course_masks)):
+        label_a, masks_a = course_masks[i]
+        for j in range(i + 1, len(course_masks)):
+            label_b, masks_b = course_masks[j]
+            for day in DAY_ORDER:
+                overlap = masks_a.get(day, 0) & masks_b.get(day, 0)
+                if overlap:
+                    for start, end in iter_runs(overlap):
+                        conflicts.append({'day': day, 'courses': [label_a, label_b],
+                                          'start': format_minutes(start), 'end': format_minutes(end),
+                                          'minutes': end - start})
+
+    days = {}
+    total_gap_minutes = 0
+    longest_back_to_back = 0
+    for day in DAY_ORDER:
+        combined = 0
+        for _, masks in course_masks:
+            combined |= masks.get(day, 0)
+        if not combined:
+            continue
+        runs = list(iter_runs(combined))
+        gaps = []
+        back_to_back = []
+        current_run = 1
+        for (_, prev_end), (next_start, _) in zip(runs, runs[1:]):
+            gap = next_start - prev_end
+            if gap <= BACK_TO_BACK_MAX_GAP:
+                current_run += 1
+            else:
+                gaps.append({'start': format_minutes(prev_end), 'end': format_minutes(next_start), 'minutes': gap})
+                if current_run > 1:
+                    back_to_back.append(current_run)
+                current_run = 1
+        if current_run > 1:
+            back_to_back.append(current_run)
+        blocks = len(runs)
+        day_gap_minutes = sum(g['minutes'] for g in gaps)
+        total_gap_minutes += day_gap_minutes
+        longest_back_to_back = max([longest_back_to_back] + back_to_back)
+        first_start, last_end = runs[0][0], runs[-1][1]
+        days[day] = {
+            'class_minutes': combined.bit_count(),
+            'class_blocks': blocks,
+            'earliest_start': format_minutes(first_start),
+            'latest_end': format_minutes(last_end),
+            'span_minutes': last_end - first_start,
+            'gaps': gaps,
+            'gap_minutes': day_gap_minutes,
+            'back_to_back_runs': back_to_back,
+        }
+
+    loads = [d['class_minutes'] for d in days.values()]
+    earliest = min((parse_time(d['earliest_start']) for d in days.values()), default=None)
+    latest = max((parse_time(d['latest_end']) for d in days.values()), default=None)
+    return {
+        'days': days,
+        'conflicts': conflicts,
+        'has_conflicts': bool(conflicts),
+        'days_on_campus': len(days),
+        'total_class_minutes': sum(loads),
+        'max_daily_minutes': max(loads, default=0),
+        'min_daily_minutes': min(loads, default=0),
+        'total_gap_minutes': total_gap_minutes,
+        'longest_back_to_back': longest_back_to_back,
+        'earliest_start': format_minutes(earliest) if earliest is not None else None,
+        'latest_end': format_minutes(latest) if latest is not None else None,
+        'unscheduled_courses': unscheduled,
+    }
+
+
+def format_schedule_metrics(metrics):
+    """Render schedule metrics as compact prompt text for the LLM."""
+    if not metrics or not metrics.get('days'):
+        return "No fixed meeting times available."
+    lines = [
+        f"Days on campus: {metrics['days_on_campus']}; total class time {metrics['total_class_minutes']} min/week; "
+        f"daily load {metrics['min_daily_minutes']}-{metrics['max_daily_minutes']} min; "
+        f"earliest start {metrics['earliest_start']}, latest end {metrics['latest_end']}; "
+        f"total gap time {metrics['total_gap_minutes']} min/week; longest back-to-back run {metrics['longest_back_to_back']} classes."
+    ]
+    for day in DAY_ORDER:
+        info = metrics['days'].get(day)
+        if not info:
+            continue
+        gap_text = ", ".join(f"{g['start']}-{g['end']} ({g['minutes']} min)" for g in info['gaps']) or "none"
+        lines.append(
+            f"- {DAY_NAMES[day]}: {info['earliest_start']}-{info['latest_end']}, {info['class_minutes']} min in class, "
+            f"{info['class_blocks']} blocks, gaps: {gap_text}, back-to-back runs: {info['back_to_back_runs'] or 'none'}")
+    if metrics['conflicts']:
+        for conflict in metrics['conflicts']:
+            lines.append(
+                f"- CONFLICT on {DAY_NAMES[conflict['day']]}: {' and '.join(conflict['courses'])} overlap "
+                f"{conflict['start']}-{conflict['end']} ({conflict['minutes']} min)")
+    else:
+        lines.append("- No time conflicts.")
+    if metrics['unscheduled_courses']:
+        lines.append(f"- No fixed meeting time: {', '.join(metrics['unscheduled_courses'])}")
+    return "\n".join(lines)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Rank conflict-free section combinations for a set of courses.
+
+Every section is reduced to one week bitset (schedule_grid.build_week_mask),
+so "does this section fit?" is a single AND against the sections already
+chosen. Sections of a course that meet at the same times with the same
+instructors are collapsed into one equivalence class, courses are searched
+fewest-classes-first, and a depth-first branch-and-bound keeps only the
+top K schedules:
+
+* a branch is cut as soon as any remaining course has no section that fits;
+* the bound assumes every remaining course gets its best *fitting* section
+  and a balance score of 100 minus the deductions the partial schedule can
+  no longer undo, and a branch is cut once that bound cannot beat the
+  current K-th best schedule;
+* the comparatively expensive schedule-balance penalties
+  (fast_analysis.score_schedule_balance) are only computed at leaves that
+  could still enter the top K;
+* the search stops after MAX_SEARCH_NODES nodes or MAX_SEARCH_SECONDS and
+  returns the best schedules found so far (stats['truncated']).
+"""
+import heapq
+import time
+
+from fast_analysis import (BACK_TO_BACK_PENALTY, BACK_TO_BACK_RUN, EARLY_START_MINUTE, EARLY_START_PENALTY,
+                           LONG_DAY_MINUTES, LONG_DAY_PENALTY, NEUTRAL_SCORE, score_schedule_balance)
+from schedule_grid import (BACK_TO_BACK_MAX_GAP, DAY_ORDER, MINUTES_PER_DAY, build_week_mask,
+                           compute_schedule_metrics, format_meetings, iter_runs)
+
+DEFAULT_TOP_K = 5
+# Share of a schedule's score from professor ratings; the rest is schedule balance
+PROFESSOR_WEIGHT = 0.7
+# Search budget, so one request can't pin a worker thread for minutes
+MAX_SEARCH_NODES = 200000
+MAX_SEARCH_SECONDS = 3.0
+
+DAY_BITS = (1 << MINUTES_PER_DAY) - 1
+EARLY_START_BITS = (1 << EARLY_START_MINUTE) - 1
+
+
+def has_fixed_back_to_back_run(day_mask, later_day_mask):
+    """True if a day has a 3+ class back-to-back run that no later section can land inside."""
+    runs = list(iter_runs(day_mask))
+    chain_start = 0
+    for i in range(1, len(runs) + 1):
+        if i < len(runs) and runs[i][0] - runs[i - 1][1] <= BACK_TO_BACK_MAX_GAP:
+            continue
+        if i - chain_start >= BACK_TO_BACK_RUN:
+            start, end = runs[chain_start][0], runs[i - 1][1]
+            if not later_day_mask & (((1 << (end - start)) - 1) << start):
+                return True
+        chain_start = i
+    return False
+
+
+def committed_balance_penalty(occupied, later):
+    """Balance deductions a partial schedule keeps however it is completed.
+
+    `occupied` is the week mask chosen so far and `later` the union of every
+    section the remaining courses could still add. Early starts and days
+    over five hours only get worse as sections are added; a back-to-back run
+    only counts if no later section overlaps it (filling a passing period
+    could merge two of its classes). Long gaps can still be filled, so they
+    are left out.
+    """
+    penalty = 0
+    for index in range(len(DAY_ORDER)):
+        shift = index * MINUTES_PER_DAY
+        day_mask = (occupied >> shift) & DAY_BITS
+        if not day_mask:
+            continue
+        if day_mask & EARLY_START_BITS:
+            penalty += EARLY_START_PENALTY
+        if day_mask.bit_count() > LONG_DAY_MINUTES:
+            penalty += LONG_DAY_PENALTY
+        if has_fixed_back_to_back_run(day_mask, (later >> shift) & DAY_BITS):
+            penalty += BACK_TO_BACK_PENALTY
+    return penalty
+
+
+def section_classes(course_id, sections):
+    """Group a course's sections into equivalence classes (same meeting times and instructors).
+
+    Returns class dicts sorted best professor score first, so the search
+    finds strong schedules early and the bound starts pruning sooner.
+    """
+    classes = {}
+    for section in sections:
+        mask = build_week_mask(section.get('meetings', []))
+        key = (mask, tuple(section.get('instructors', [])))
+        if key not in classes:
+            classes[key] = {'course_id': course_id, 'mask': mask, 'sections': [],
+                            'score': section.get('professor_score', NEUTRAL_SCORE)}
+        classes[key]['sections'].append(section)
+        classes[key]['score'] = max(classes[key]['score'], section.get('professor_score', NEUTRAL_SCORE))
+    return sorted(classes.values(), key=lambda c: -c['score'])
+
+
+def optimize_sections(course_sections, top_k=DEFAULT_TOP_K, professor_weight=PROFESSOR_WEIGHT,
+                      max_nodes=MAX_SEARCH_NODES, max_seconds=MAX_SEARCH_SECONDS):
+    """Return the top-K conflict-free schedules and search statistics.
+
+    `course_sections` maps course id -> list of section dicts with
+    'section_id', 'meetings', 'instructors' and an optional 'professor_score'
+    (0-100, default neutral). Every course must have at least one section.
+    If the search exceeds `max_nodes` or `max_seconds`, the best schedules
+    found so far are returned and stats['truncated'] is True.
+    """
+    started = time.perf_counter()
+    deadline = started + max_seconds
+    courses = sorted(((course_id, section_classes(course_id, sections))
+                      for course_id, sections in course_sections.items()), key=lambda item: len(item[1]))
+    if not courses or any(not classes for _, classes in courses):
+        raise ValueError("Every course needs at least one section to optimize.")
+    course_count = len(courses)
+    class_lists = [classes for _, classes in courses]
+    # later_masks[d]: every minute a class of course d or later could occupy
+    later_masks = [0] * (course_count + 1)
+    for depth in range(course_count - 1, -1, -1):
+        later_masks[depth] = later_masks[depth + 1]
+        for cls in class_lists[depth]:
+            later_masks[depth] |= cls['mask']
+    balance_weight = 1 - professor_weight
+    stats = {'nodes': 0, 'conflict_prunes': 0, 'dead_end_prunes': 0, 'bound_prunes': 0,
+             'leaves': 0, 'leaves_scored': 0, 'truncated': False,
+             'section_count': sum(len(s) for s in course_sections.values()),
+             'class_count': sum(len(c) for c in class_lists)}
+    heap = []  # (score, sequence, schedule) min-heap of the best K
+    sequence = 0
+
+    def threshold():
+        return heap[0][0] if len(heap) >= top_k else float('-inf')
+
+    def best_fitting(depth, occupied):
+        """Sum of the best fitting class score of each course from `depth` on (None if one can't fit)."""
+        total = 0
+        for classes in class_lists[depth:]:
+            # Classes are sorted by score, so the first fitting one is the best
+            best = next((c['score'] for c in classes if not c['mask'] & occupied), None)
+            if best is None:
+                return None
+            total += best
+        return total
+
+    def best_balance(depth, occupied):
+        return max(0, 100 - committed_balance_penalty(occupied, later_masks[depth]))
+
+    def score_leaf(chosen, occupied, professor_total):
+        nonlocal sequence
+        stats['leaves'] += 1
+        professor_score = professor_total / course_count
+        if professor_weight * professor_score + balance_weight * best_balance(course_count, occupied) <= threshold():
+            stats['bound_prunes'] += 1
+            return
+        stats['leaves_scored'] += 1
+        metrics = compute_schedule_metrics([
+            {'course_id': c['course_id'], 'section_id': c['sections'][0]['section_id'],
+             'meetings': c['sections'][0].get('meetings', [])} for c in chosen])
+        balance_score, balance_notes = score_schedule_balance(metrics)
+        score = professor_weight * professor_score + balance_weight * balance_score
+        if score <= threshold():
+            return
+        schedule = {'score': round(score, 1), 'professor_score': round(professor_score, 1),
+                    'balance_score': balance_score, 'balance_notes': balance_notes,
+                    'classes': list(chosen), 'schedule_metrics': metrics}
+        sequence += 1
+        if len(heap) < top_k:
+            heapq.heappush(heap, (score, -sequence, schedule))
+        else:
+            heapq.heapreplace(heap, (score, -sequence, schedule))
+
+    def search(depth, occupied, chosen, professor_total):
+        if stats['truncated']:
+            return
+        stats['nodes'] += 1
+        if stats['nodes'] > max_nodes or (stats['nodes'] % 1024 == 0 and time.perf_counter() > deadline):
+            stats['truncated'] = True
+            return
+        if depth == course_count:
+            score_leaf(chosen, occupied, professor_total)
+            return
+        for cls in class_lists[depth]:
+            if cls['mask'] & occupied:
+                stats['conflict_prunes'] += 1
+                continue
+            next_occupied = occupied | cls['mask']
+            next_total = professor_total + cls['score']
+            remaining = best_fitting(depth + 1, next_occupied)
+            if remaining is None:
+                stats['dead_end_prunes'] += 1
+                continue
+            # Cheap professor-only bound first; the balance deductions cost a pass over the week
+            bound = professor_weight * (next_total + remaining) / course_count
+            if bound + balance_weight * 100 <= threshold() or \
+                    bound + balance_weight * best_balance(depth + 1, next_occupied) <= threshold():
+                stats['bound_prunes'] += 1
+                # Later classes of this course score no higher, but may fit better; keep scanning
+                continue
+            chosen.append(cls)
+            search(depth + 1, next_occupied, chosen, next_total)
+            chosen.pop()
+
+    search(0, 0, [], 0)
+    stats['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    # Report courses in the order they were requested
+    order = {course_id: i for i, course_id in enumerate(course_sections)}
+    schedules = []
+    for rank, (_, _, schedule) in enumerate(sorted(heap, key=lambda item: (-item[0], -item[1])), 1):
+        classes = sorted(schedule.pop('classes'), key=lambda c: order[c['course_id']])
+        schedule['rank'] = rank
+        schedule['sections'] = [describe_class(c) for c in classes]
+        schedules.append(schedule)
+    return schedules, stats
+
+
+def describe_class(cls):
+    """JSON-friendly description of a chosen equivalence class."""
+    first = cls['sections'][0]
+    return {
+        'course_id': cls['course_id'],
+        'section_id': first['section_id'],
+        'alternate_sections': [s['section_id'] for s in cls['sections'][1:]],
+        'instructors': first.get('instructors', []),
+        'professor_score': round(cls['score'], 1),
+        'schedule': format_meetings(first.get('meetings', [])) or 'N/A',
+        'meetings': first.get('meetings', []),
+        'open_seats': [s.get('open_seats') for s in cls['sections']],
+    }
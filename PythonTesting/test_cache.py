@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Stampede and stale-refresh behaviour of every cache backend.
+
+The Redis backend runs against fakeredis (skipped if it isn't installed).
+
+Usage: python -m pytest test_cache.py
+"""
+import asyncio
+
+import pytest
+
+from cache import MemoryCache, RedisCache, SQLiteCache
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def make_cache(request, tmp_path):
+    """Factory for a fresh cache of each backend (call it inside the event loop)."""
+    if request.param == 'memory':
+        return MemoryCache
+    if request.param == 'sqlite':
+        return lambda: SQLiteCache(str(tmp_path / 'cache.db'))
+    fakeredis = pytest.importorskip('fakeredis')
+    return lambda: RedisCache(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+def counting_compute(delay=0.0, value='value'):
+    """Coroutine function returning `value` after `delay`; calls are counted in .calls."""
+    async def compute():
+        compute.calls += 1
+        await asyncio.sleep(delay)
+        return value
+    compute.calls = 0
+    return compute
+
+
+def test_concurrent_misses_compute_once(make_cache):
+    async def run():
+        cache = make_cache()
+        compute = counting_compute(delay=0.2)
+        try:
+            values = await asyncio.gather(*(cache.get_or_compute('key', compute, ttl=60) for _ in range(20)))
+        finally:
+            await cache.close()
+        return values, compute.calls
+
+    values, calls = asyncio.run(run())
+    assert values == ['value'] * 20
+    assert calls == 1
+
+
+def test_stale_entry_is_served_and_refreshed_once(make_cache):
+    async def run():
+        cache = make_cache()
+        try:
+            await cache.set('key', 'old', ttl=0.1, stale_ttl=60)
+            await asyncio.sleep(0.2)
+            compute = counting_compute(delay=0.1, value='new')
+            values = await asyncio.gather(*(cache.get_or_compute('key', compute, ttl=60, stale_ttl=60)
+                                            for _ in range(20)))
+            await asyncio.sleep(0.3)
+            return values, compute.calls, await cache.get('key')
+        finally:
+            await cache.close()
+
+    values, calls, refreshed = asyncio.run(run())
+    assert values == ['old'] * 20
+    assert calls == 1
+    assert refreshed == 'new'
+
+
+def test_stale_ttl_zero_recomputes_in_the_caller(make_cache):
+    async def run():
+        cache = make_cache()
+        try:
+            await cache.set('key', 'old', ttl=0.1, stale_ttl=60)
+            await asyncio.sleep(0.2)
+            compute = counting_compute(value='new')
+            return await cache.get_or_compute('key', compute, ttl=60, stale_ttl=0), compute.calls
+        finally:
+            await cache.close()
+
+    assert asyncio.run(run()) == ('new', 1)
+
+
+@pytest.mark.parametrize('lock_timeout, expected_calls', [(2, 1), (0.2, 2)])
+def test_lock_must_outlive_compute(make_cache, lock_timeout, expected_calls):
+    """A lock that expires mid-compute lets a waiter compute again (the duplicate-call case)."""
+    async def run():
+        cache = make_cache()
+        compute = counting_compute(delay=0.6)
+        try:
+            await asyncio.gather(*(cache.get_or_compute('key', compute, ttl=60, stale_ttl=0,
+                                                        lock_timeout=lock_timeout) for _ in range(2)))
+        finally:
+            await cache.close()
+        return compute.calls
+
+    assert asyncio.run(run()) == expected_calls
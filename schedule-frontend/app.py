@@ -1,25 +1,30 @@
 import os
-import subprocess
+import re
+import time
 import uuid
-import json
-from flask import Flask, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
 import sys
+from quart import Quart, request, jsonify, send_from_directory
+from werkzeug.utils import secure_filename
 
 # Add the PythonTesting directory to the Python path
 script_dir = os.path.dirname(os.path.abspath(__file__))
 python_testing_dir = os.path.abspath(os.path.join(script_dir, '..', 'PythonTesting'))
+sys.path.insert(0, python_testing_dir)
+
+import enhanced_schedule_analyzer as analyzer
 
-app = Flask(__name__, static_folder='static')
+# ASGI app: run with `hypercorn app:app --bind 0.0.0.0:5001` (or `python app.py` for development).
+# Each analysis is awaited on the server's event loop, so thousands of mostly
+# I/O-waiting analyses share one process instead of holding a thread each.
+app = Quart(__name__, static_folder='static')
 
 # Configuration
 UPLOAD_FOLDER = 'uploads' # Bring back upload folder
+PROFILE_FOLDER = os.path.join(python_testing_dir, 'profiles') # ?profile=1 traces
+MAX_SAVED_PROFILES = 50 # Oldest traces beyond this are deleted...
+PROFILE_MAX_AGE = 24 * 3600 # ...as are traces older than a day
+PROFILE_FILE_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.(trace\.json|cpu\.folded)")
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-PYTHON_EXECUTABLE = sys.executable
-SCRIPT_PATH = os.path.abspath(os.path.join(python_testing_dir, 'enhanced_schedule_analyzer.py'))
-OUTPUT_DIR = python_testing_dir
-OUTPUT_TXT_FILENAME = 'enhanced_schedule_analysis.txt'
-OUTPUT_JSON_FILENAME = 'schedule_data.json'
 
 # Ensure the upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -29,21 +34,79 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_serving
+async def open_shared_clients():
+    # One pooled HTTP client for Testudo/PlanetTerp, shared by every request
+    analyzer.get_http_client()
+    # Research/summary cache; set TERPORACLE_CACHE=sqlite:///... or redis://... so workers share it
+    analyzer.configure_cache()
+
+@app.after_serving
+async def close_shared_clients():
+    await analyzer.close_http_client()
+    await analyzer.close_gemini_clients()
+    await analyzer.close_cache()
+
 @app.route('/')
-def index():
-    return send_from_directory(app.static_folder, 'index.html')
+async def index():
+    return await send_from_directory(app.static_folder, 'index.html')
 
 @app.route('/<path:filename>')
-def static_files(filename):
-    return send_from_directory(app.static_folder, filename)
+async def static_files(filename):
+    return await send_from_directory(app.static_folder, filename)
+
+def prune_profiles():
+    """Delete saved profiles older than PROFILE_MAX_AGE or beyond the newest MAX_SAVED_PROFILES."""
+    profiles = {}
+    for filename in os.listdir(PROFILE_FOLDER):
+        if PROFILE_FILE_PATTERN.fullmatch(filename):
+            path = os.path.join(PROFILE_FOLDER, filename)
+            profiles.setdefault(filename[:36], []).append((os.path.getmtime(path), path))
+    newest_first = sorted(profiles.values(), key=lambda files: max(files)[0], reverse=True)
+    cutoff = time.time() - PROFILE_MAX_AGE
+    for index, files in enumerate(newest_first):
+        if index >= MAX_SAVED_PROFILES or max(files)[0] < cutoff:
+            for _, path in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def save_profile(profiler):
+    """Write a request's trace (and CPU samples) and return their download URLs."""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    profile_id = str(uuid.uuid4())
+    paths = profiler.save(os.path.join(PROFILE_FOLDER, f"{profile_id}.trace.json"),
+                          os.path.join(PROFILE_FOLDER, f"{profile_id}.cpu.folded"))
+    prune_profiles()
+    profile = {kind: f"/profiles/{os.path.basename(path)}" for kind, path in paths.items()}
+    if 'cpu' in paths:
+        profile['cpu_note'] = ("CPU samples cover every thread in the server process, "
+                               "so concurrent requests are mixed into this profile.")
+    return profile
+
+@app.route('/profiles/<path:filename>')
+async def profile_files(filename):
+    # Only the unguessable per-request files written by save_profile
+    if not PROFILE_FILE_PATTERN.fullmatch(filename):
+        return jsonify({"error": "Not found"}), 404
+    return await send_from_directory(PROFILE_FOLDER, filename)
 
 @app.route('/analyze', methods=['POST'])
-def analyze_schedule():
+async def analyze_schedule():
     api_key = None
     term_id = None
     image_path_to_process = None
     is_manual_input = False
     courses_input = None # For manual input
+    # 'fast' skips Gemini and scores from review statistics only
+    analysis_mode = request.args.get('mode', 'full')
+    # ?profile=1 records a timeline trace, ?profile=cpu also samples CPU stacks;
+    # anything else (including ?profile=0) leaves profiling off
+    profile_mode = request.args.get('profile', '').strip().lower()
+    if profile_mode not in ('1', 'cpu'):
+        profile_mode = None
+    profiler = None
 
     # Determine input type based on Content-Type
     content_type = request.headers.get('Content-Type', '').lower()
@@ -55,44 +118,39 @@ def analyze_schedule():
         if not request.is_json:
             return jsonify({"error": "Request must be JSON"}), 415
 
-        data = request.get_json()
+        data = await request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "JSON payload must be an object"}), 400
         courses_input = data.get('courses')
         api_key = data.get('apiKey')
         term_id = data.get('termId', '202508')
+        analysis_mode = data.get('mode', analysis_mode)
 
         if not courses_input or not isinstance(courses_input, list) or len(courses_input) == 0:
             return jsonify({"error": "Missing or invalid 'courses' list in JSON payload"}), 400
-
-        # --- IMPORTANT: Manual input requires script modification ---
-        # We will pass a dummy image path, but the script needs to be adapted
-        # to potentially ignore the image and use provided course data.
-        # Create a dummy file path (it won't contain real data)
-        dummy_filename = f"manual_input_{uuid.uuid4()}.dummy"
-        image_path_to_process = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], dummy_filename))
-        try:
-            with open(image_path_to_process, 'w') as f: f.write("manual input placeholder")
-            print(f"[*] Created dummy file for manual input: {image_path_to_process}")
-        except Exception as e:
-             print(f"[!] Error creating dummy file: {e}")
-             return jsonify({"error": "Server error creating temporary file."}), 500
+        if any(not isinstance(c, dict) or 'course_id' not in c or 'section' not in c for c in courses_input):
+            return jsonify({"error": "Each course object must have 'course_id' and 'section'."}), 400
 
     elif 'multipart/form-data' in content_type:
         # --- Handle Form Data (Image Upload) ---
         print("[*] Handling multipart/form-data request (image upload)")
-        if 'scheduleImage' not in request.files:
+        files = await request.files
+        form = await request.form
+        if 'scheduleImage' not in files:
             return jsonify({"error": "No image file part"}), 400
-        file = request.files['scheduleImage']
+        file = files['scheduleImage']
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
 
-        api_key = request.form.get('apiKey')
-        term_id = request.form.get('termId', '202508')
+        api_key = form.get('apiKey')
+        term_id = form.get('termId', '202508')
+        analysis_mode = form.get('mode', analysis_mode)
 
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             unique_filename = str(uuid.uuid4()) + "_" + filename
             temp_image_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(temp_image_path)
+            await file.save(temp_image_path)
             image_path_to_process = os.path.abspath(temp_image_path) # Use absolute path
             print(f"[*] Image saved temporarily to: {image_path_to_process}")
         else:
@@ -101,91 +159,139 @@ def analyze_schedule():
         return jsonify({"error": f"Unsupported Content-Type: {content_type}"}), 415
 
     # --- Common Logic: API Key Check ---
-    if not api_key:
+    # Fast mode only needs Gemini to read a schedule image
+    if not api_key and not (analysis_mode == 'fast' and is_manual_input):
          api_key = os.environ.get('GEMINI_API_KEY') # Fallback to env var
          if not api_key:
-              # Clean up dummy file if created
-              if is_manual_input and image_path_to_process and os.path.exists(image_path_to_process):
+              if image_path_to_process and os.path.exists(image_path_to_process):
                   os.remove(image_path_to_process)
               return jsonify({"error": "API Key is required."}), 400
 
-    # --- Common Logic: Execute Script ---
-    output_txt_path = os.path.join(OUTPUT_DIR, OUTPUT_TXT_FILENAME)
-    output_json_path = os.path.join(OUTPUT_DIR, OUTPUT_JSON_FILENAME)
-
-    # Ensure old output files are removed
+    # --- Common Logic: Run Analysis on this event loop ---
+    if profile_mode:
+        profiler = analyzer.start_profiling('web', sample_cpu=profile_mode == 'cpu')
     try:
-        if os.path.exists(output_txt_path): os.remove(output_txt_path)
-        if os.path.exists(output_json_path): os.remove(output_json_path)
-    except OSError as e:
-        print(f"[*] Warning: Could not remove old output file(s): {e}")
-
-    # Prepare command for the script
-    command = [ PYTHON_EXECUTABLE, SCRIPT_PATH ]
-
-    # Add arguments based on input type
-    if is_manual_input and courses_input:
-        # For manual input, pass --courses-json and skip image_path argument in script logic
-        command.extend(['--courses-json', json.dumps(courses_input)])
-        # We still pass a dummy image path because argparse in the script might expect it,
-        # but the script logic should ignore it when --courses-json is present.
-        command.extend([image_path_to_process]) # Add dummy image path as positional arg if needed
-    else:
-        # For image input, pass the image path as the positional argument
-        command.extend([image_path_to_process])
-
-    # Add common arguments
-    command.extend([
-        '--term', term_id,
-        '--output', OUTPUT_TXT_FILENAME,
-        '--json', OUTPUT_JSON_FILENAME,
-        '--api-key', api_key
-    ])
+        models = analyzer.setup_gemini_api(api_key) if api_key else None
 
-    try:
-        print(f"[*] Running script: {' '.join(command)}")
-        process = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True, # Raise error on non-zero exit code
-            cwd=python_testing_dir # Run from script's directory
-        )
-        print(f"[*] Script stdout:\n{process.stdout}")
-        print(f"[*] Script stderr:\n{process.stderr}")
-        print(f"[*] Script finished successfully.")
-
-        # Read the generated JSON output file
-        if os.path.exists(output_json_path):
-            with open(output_json_path, 'r', encoding='utf-8') as f:
-                analysis_data = json.load(f)
-            return jsonify(analysis_data) # Return the structured JSON
+        if is_manual_input:
+            courses = analyzer.dedupe_courses(courses_input, "input")
         else:
-            print(f"[*] Error: Output JSON file not found at {output_json_path}")
-            # Include script output in error if possible
-            stderr_output = process.stderr if process else "N/A"
-            return jsonify({"error": "Analysis script ran but did not produce the expected JSON output file.", "stderr": stderr_output}), 500
-
-    except subprocess.CalledProcessError as e:
-        print(f"[*] Error executing script: {e}")
-        print(f"[*] Script stdout:\n{e.stdout}")
-        print(f"[*] Script stderr:\n{e.stderr}")
-        return jsonify({"error": "Failed to execute analysis script.", "details": str(e), "stdout": e.stdout, "stderr": e.stderr}), 500
+            extracted_courses = await analyzer.extract_courses_from_image(
+                image_path_to_process, models['vision_model'])
+            courses = analyzer.dedupe_courses(extracted_courses or [], "extracted from image")
+
+        if not courses:
+            return jsonify({"metadata": {}, "overall_analysis": "No courses found.", "courses": []})
+
+        print(f"[*] Analyzing {len(courses)} course(s) for term {term_id} (mode: {analysis_mode})")
+        fast = analysis_mode == 'fast'
+        llm_usage = {}
+        course_summaries, overall_summary, schedule_metrics = await analyzer.analyze_courses(
+            courses, term_id, models, fast=fast, llm_usage=llm_usage)
+        if not course_summaries:
+            return jsonify({"error": "No course summaries generated."}), 500
+
+        json_data = analyzer.build_json_data(
+            course_summaries, overall_summary, schedule_metrics, mode='fast' if fast else 'full', llm_usage=llm_usage)
+        # Lets the client send only its edits to /reanalyze later
+        json_data['metadata']['analysis_id'] = await analyzer.save_analysis(
+            courses, term_id, 'fast' if fast else 'full', course_summaries)
+        if profiler:
+            profiler.stop()
+            json_data['metadata']['profile'] = save_profile(profiler)
+        return jsonify(json_data)
+
     except Exception as e:
         print(f"[*] An unexpected error occurred: {e}")
         return jsonify({"error": "An unexpected server error occurred.", "details": str(e)}), 500
     finally:
-        # Clean up uploaded image or dummy file
+        if profiler:
+            profiler.stop()
+        # Clean up uploaded image
         if image_path_to_process and os.path.exists(image_path_to_process):
             try:
                 os.remove(image_path_to_process)
                 print(f"[*] Cleaned up temp file: {image_path_to_process}")
             except OSError as e:
                 print(f"[*] Warning: Could not remove temp file {image_path_to_process}: {e}")
-        # Optionally clean up output files (or leave for debugging)
-        # if os.path.exists(output_txt_path): os.remove(output_txt_path)
-        # if os.path.exists(output_json_path): os.remove(output_json_path)
+
+@app.route('/reanalyze', methods=['POST'])
+async def reanalyze_schedule():
+    """Re-analyze an edited schedule from a previous analysis id plus a diff.
+
+    JSON body: {"analysisId", "added", "removed", "changed", "apiKey", "mode"}.
+    Unchanged sections reuse their stored summaries; only new sections are
+    researched and summarized, and the overall summary is regenerated.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 415
+    data = await request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON payload must be an object"}), 400
+
+    previous = await analyzer.load_analysis(data.get('analysisId'))
+    if not previous:
+        return jsonify({"error": "Unknown or expired analysisId; run /analyze again."}), 404
+
+    try:
+        courses = analyzer.apply_schedule_diff(
+            previous['courses'], data.get('added'), data.get('removed'), data.get('changed'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not courses:
+        return jsonify({"error": "The edited schedule has no courses."}), 400
+
+    analysis_mode = data.get('mode', request.args.get('mode', previous['mode']))
+    fast = analysis_mode == 'fast'
+    analysis_mode = 'fast' if fast else 'full'
+    api_key = data.get('apiKey') or os.environ.get('GEMINI_API_KEY')
+    if not api_key and not fast:
+        return jsonify({"error": "API Key is required."}), 400
+
+    try:
+        models = analyzer.setup_gemini_api(api_key) if api_key else None
+        print(f"[*] Re-analyzing {len(courses)} course(s) from analysis {data['analysisId']} (mode: {analysis_mode})")
+        llm_usage = {}
+        course_summaries, overall_summary, schedule_metrics, reused = await analyzer.reanalyze_courses(
+            previous, courses, models, fast=fast, llm_usage=llm_usage)
+        if not course_summaries:
+            return jsonify({"error": "No course summaries generated."}), 500
+
+        json_data = analyzer.build_json_data(
+            course_summaries, overall_summary, schedule_metrics, mode=analysis_mode, llm_usage=llm_usage)
+        json_data['metadata']['analysis_id'] = await analyzer.save_analysis(
+            courses, previous['term_id'], analysis_mode, course_summaries)
+        json_data['metadata']['previous_analysis_id'] = data['analysisId']
+        json_data['metadata']['reused_courses'] = reused
+        return jsonify(json_data)
+
+    except Exception as e:
+        print(f"[*] An unexpected error occurred: {e}")
+        return jsonify({"error": "An unexpected server error occurred.", "details": str(e)}), 500
+
+@app.route('/optimize', methods=['POST'])
+async def optimize_schedule_sections():
+    """Rank conflict-free section combinations. JSON body: {"courseIds", "termId", "topK"}."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 415
+    data = await request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON payload must be an object"}), 400
+    course_ids = data.get('courseIds')
+    if not course_ids or not isinstance(course_ids, list) or not all(isinstance(c, str) for c in course_ids):
+        return jsonify({"error": "Missing or invalid 'courseIds' list in JSON payload"}), 400
+    try:
+        top_k = max(1, min(int(data.get('topK', analyzer.DEFAULT_TOP_K)), 50))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'topK' must be an integer"}), 400
+
+    try:
+        result = await analyzer.optimize_schedule(course_ids, data.get('termId', '202508'), top_k)
+        return jsonify(result)
+    except Exception as e:
+        print(f"[*] An unexpected error occurred: {e}")
+        return jsonify({"error": "An unexpected server error occurred.", "details": str(e)}), 500
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5001)
@@ -99,6 +99,31 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Form Submission ---
 
+    // Last full manual analysis, so a resubmit after small edits only sends the diff
+    let lastAnalysis = null;
+
+    function courseKey(course) {
+        return `${course.course_id}-${course.section.padStart(4, '0')}`;
+    }
+
+    function diffCourses(previousCourses, courses) {
+        const previousKeys = new Set(previousCourses.map(courseKey));
+        const currentKeys = new Set(courses.map(courseKey));
+        const removed = previousCourses.filter(c => !currentKeys.has(courseKey(c)));
+        const added = courses.filter(c => !previousKeys.has(courseKey(c)));
+        // A removed and an added section of the same course is a section swap
+        const changed = [];
+        added.slice().forEach(course => {
+            const swapped = removed.findIndex(c => c.course_id === course.course_id);
+            if (swapped !== -1) {
+                changed.push({ course_id: course.course_id, from_section: removed[swapped].section, section: course.section });
+                removed.splice(swapped, 1);
+                added.splice(added.indexOf(course), 1);
+            }
+        });
+        return { added, removed, changed };
+    }
+
     analyzeForm.addEventListener('submit', async (event) => {
         event.preventDefault();
 
@@ -149,15 +174,43 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             fetchOptions.body = requestBody;
-            const response = await fetch('/analyze', fetchOptions);
-            const result = await response.json();
 
-            if (!response.ok) {
-                // Include stderr in the error message if available
-                const errorDetails = result.stderr ? `\n\nServer Error Details:\n${result.stderr}` : '';
-                throw new Error((result.error || `Server error: ${response.status}`) + errorDetails);
+            const manualPayload = selectedMethod === 'manual' ? JSON.parse(requestBody) : null;
+            if (manualPayload && lastAnalysis && lastAnalysis.termId === termId) {
+                // Edited schedule: only the changed sections are re-analyzed
+                const diff = diffCourses(lastAnalysis.courses, manualPayload.courses);
+                const reanalysis = await fetchAnalysis('/reanalyze', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ analysisId: lastAnalysis.id, apiKey, ...diff }),
+                }).catch(error => {
+                    console.warn('Incremental re-analysis failed, running a full analysis:', error);
+                    return null;
+                });
+                if (reanalysis) {
+                    lastAnalysis = { id: reanalysis.metadata.analysis_id, termId, courses: manualPayload.courses };
+                    displayResults(reanalysis);
+                    return;
+                }
             }
 
+            // Show a quick statistics-only estimate while the full AI analysis runs.
+            // Manual input only: for an image the preview would repeat the Gemini
+            // vision extraction and all the research the full request already does.
+            let fullAnalysisDone = false;
+            if (manualPayload) {
+                fetchAnalysis('/analyze?mode=fast', fetchOptions)
+                    .then(preview => {
+                        if (!fullAnalysisDone) displayResults(preview, true);
+                    })
+                    .catch(error => console.warn('Fast preview failed:', error));
+            }
+
+            const result = await fetchAnalysis('/analyze', fetchOptions)
+                .finally(() => { fullAnalysisDone = true; });
+            lastAnalysis = manualPayload && result.metadata && result.metadata.analysis_id
+                ? { id: result.metadata.analysis_id, termId, courses: manualPayload.courses }
+                : null;
             displayResults(result);
 
         } catch (error) {
@@ -170,6 +223,18 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    async function fetchAnalysis(url, fetchOptions) {
+        const response = await fetch(url, fetchOptions);
+        const result = await response.json();
+
+        if (!response.ok) {
+            // Include server error details in the message if available
+            const errorDetails = result.details ? `\n\nServer Error Details:\n${result.details}` : '';
+            throw new Error((result.error || `Server error: ${response.status}`) + errorDetails);
+        }
+        return result;
+    }
+
     // --- Display Results ---
 
     // Simple Markdown Renderer (handles **bold** and newlines)
@@ -190,7 +255,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
-    function displayResults(data) {
+    function displayResults(data, isPreview = false) {
         // Clear previous results
         overallAnalysisContent.innerHTML = '';
         individualCoursesContent.innerHTML = '';
@@ -200,7 +265,7 @@ document.addEventListener('DOMContentLoaded', () => {
         gradeValueSpan.textContent = '--'; // Reset grade value
 
         if (data.error) {
-            showError(data.error + (data.stderr ? `\n\nServer Error Details:\n${data.stderr}` : ''));
+            showError(data.error + (data.details ? `\n\nServer Error Details:\n${data.details}` : ''));
             return;
         }
 
@@ -215,6 +280,28 @@ document.addEventListener('DOMContentLoaded', () => {
         let analysisText = data.overall_analysis || 'Overall analysis not available.';
         analysisText = analysisText.replace(/^Overall Schedule Grade:\s*\d+\s*\/\s*100\s*\n?/, ''); // Remove grade line
         overallAnalysisContent.innerHTML = renderMarkdown(analysisText);
+        if (isPreview) {
+            const previewNotice = document.createElement('p');
+            previewNotice.innerHTML = '<i>Quick estimate from review statistics. The full AI analysis is still running and will replace this shortly...</i>';
+            overallAnalysisContent.prepend(previewNotice);
+        }
+
+        // Display exact schedule structure computed from meeting times
+        const metrics = data.schedule_metrics;
+        if (metrics && metrics.days && Object.keys(metrics.days).length > 0) {
+            const metricsP = document.createElement('p');
+            metricsP.style.fontSize = '0.85em';
+            let metricsText = `<i>Schedule Structure: ${metrics.days_on_campus} days on campus, ${metrics.total_class_minutes} min/week in class, ` +
+                              `earliest ${metrics.earliest_start}, latest ${metrics.latest_end}, ${metrics.total_gap_minutes} min/week of gaps</i>`;
+            if (metrics.conflicts && metrics.conflicts.length > 0) {
+                const conflictText = metrics.conflicts
+                    .map(c => `${c.courses.join(' / ')} on ${c.day} ${c.start}-${c.end}`)
+                    .join('; ');
+                metricsText += `<br><strong>Time conflicts: ${renderMarkdown(conflictText)}</strong>`;
+            }
+            metricsP.innerHTML = metricsText;
+            overallAnalysisContent.appendChild(metricsP);
+        }
 
         // Display Individual Course Analyses
         if (data.courses && data.courses.length > 0) {
@@ -238,10 +325,12 @@ document.addEventListener('DOMContentLoaded', () => {
                     const stats = course.research_stats;
                     const researchP = document.createElement('p');
                     researchP.style.fontSize = '0.85em';
-                    // Calculate lengths safely, defaulting to 0 if key missing or not an array
-                    const direct_reviews_count = Array.isArray(stats.direct_reviews) ? stats.direct_reviews.length : 0;
-                    const prof_other_reviews_count = Array.isArray(stats.professor_other_reviews) ? stats.professor_other_reviews.length : 0;
-                    const course_other_reviews_count = Array.isArray(stats.course_other_reviews) ? stats.course_other_reviews.length : 0;
+                    // Calculate lengths safely; courses reused by /reanalyze only carry review_counts
+                    const counts = stats.review_counts || {};
+                    const countOf = bucket => bucket in counts ? counts[bucket] : (Array.isArray(stats[bucket]) ? stats[bucket].length : 0);
+                    const direct_reviews_count = countOf('direct_reviews');
+                    const prof_other_reviews_count = countOf('professor_other_reviews');
+                    const course_other_reviews_count = countOf('course_other_reviews');
                     researchP.innerHTML = `<i>Research Depth: ${direct_reviews_count} direct, ${prof_other_reviews_count} prof-other, ${course_other_reviews_count} course-other</i>`;
                     meta.appendChild(researchP);
                 }